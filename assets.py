@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import argparse
+import ast
+import hashlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+
+import sprite_handler as sh
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Sprites exist in three forms, all of them keyed by sprite_handler keys like "babies/0/idle":
+#   hex  a Python module of NAME = (frame, ...) tuples of 32 row ints, like tools/tama_og.py, bit x of a row
+#        is pixel x as in PackedSprite. Single-frame sprites may be a bare frame.
+#   csv  a folder of NAME_<frame>.csv files, frames counted from 1, a line of 0/1 per row with the most
+#        significant bit first, which is the hex tuples printed as they are written.
+#   png  a sprite tree like sprites/, black pixels are lit. Frames of a key are key/0.png, key/1.png, ...
+#        and a single frame is key.png.
+# csv and hex name sprites like the original game, see ALIASES.
+FORMATS = ("hex", "csv", "png")
+# Names of the original game's sprites that differ from SPRITES.
+ALIASES = {"IDLE_MATURE": "IDLE_CHILD", "SLEEP_MATURE": "SLEEP_CHILD"}
+# Per destination, hashes of the sources each key was last converted from and of the files written for it.
+MANIFEST = ".asset_hashes.json"
+
+# A sprite's frames as packed rows, shape (frames, 32).
+Frames = np.ndarray
+
+
+def key_of(name: str) -> str:
+    # Sprites unknown to SPRITES keep their name as key, e.g. a new NAME_1.csv becomes sprites/NAME.png.
+    name = ALIASES.get(name, name)
+    return sh.SPRITES[name][0] if name in sh.SPRITES else name
+
+
+def name_of(key: str) -> str:
+    names = {entry[0]: name for name, entry in sh.SPRITES.items()}
+    names.update({sh.SPRITES[name][0]: alias for alias, name in ALIASES.items()})
+    return names.get(key, key.replace("/", "_").upper())
+
+
+def pack_bits(bits: np.ndarray, bitorder: str) -> Frames:
+    # (frames, 32, 32) pixels to packed rows, "little" puts column 0 in bit 0 and "big" in bit 31.
+    packed = np.packbits(bits.astype(np.uint8), axis=2, bitorder=bitorder)
+    return packed.view("<u4" if bitorder == "little" else ">u4").reshape(len(bits), 32).astype(np.uint32)
+
+
+def unpack_bits(frames: Frames, bitorder: str) -> np.ndarray:
+    packed = frames.astype("<u4" if bitorder == "little" else ">u4").view(np.uint8).reshape(len(frames), 32, 4)
+    return np.unpackbits(packed, axis=2, bitorder=bitorder)
+
+
+TRANSFORMS: Dict[str, Callable[[Frames], Frames]] = {
+    "hflip": lambda frames: pack_bits(unpack_bits(frames, "little")[:, :, ::-1], "little"),
+    "vflip": lambda frames: frames[:, ::-1],
+    "invert": lambda frames: ~frames,
+}
+
+
+def read_bytes(files: List[str]) -> bytes:
+    contents = []
+    for filename in files:
+        with open(filename, "rb") as f:
+            contents.append(f.read())
+    return b"\0".join(contents)
+
+
+def read_hex(filename: str) -> Dict[str, Tuple[Frames, bytes]]:
+    # Parsed without importing, so modules that open a window on import can be read as well.
+    with open(filename, encoding="utf-8") as f:
+        source = f.read()
+    sprites = {}
+    for node in ast.parse(source).body:
+        if not (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)):
+            continue
+        try:
+            value = ast.literal_eval(node.value)
+        except ValueError:
+            continue
+        if not isinstance(value, tuple):
+            continue
+        frames = (value,) if len(value) == 32 and all(isinstance(row, int) for row in value) else value
+        if all(isinstance(frame, tuple) and len(frame) == 32 for frame in frames):
+            segment = ast.get_source_segment(source, node.value).encode()
+            sprites[key_of(node.targets[0].id)] = (np.array(frames, dtype=np.uint32), segment)
+    return sprites
+
+
+def write_hex(filename: str, sprites: Dict[str, Frames]) -> None:
+    lines = []
+    for key, frames in sorted(sprites.items()):
+        tuples = ", ".join("(" + ",".join(hex(row) for row in frame.tolist()) + ")" for frame in frames)
+        lines.append(f"{name_of(key)} = ({tuples}{',' if len(frames) == 1 else ''})\n")
+    write_if_changed(filename, "".join(lines).encode())
+
+
+def csv_files(folder: str) -> Dict[str, List[str]]:
+    # Frame files of every key in folder, in frame order.
+    frames: Dict[str, Dict[int, str]] = {}
+    for filename in os.listdir(folder):
+        name, _, frame = filename[:-4].rpartition("_")
+        if filename.endswith(".csv") and frame.isdigit():
+            frames.setdefault(key_of(name), {})[int(frame)] = os.path.join(folder, filename)
+    return {key: [files[frame] for frame in sorted(files)] for key, files in frames.items()}
+
+
+def read_csv(files: List[str]) -> Frames:
+    text = b" ".join(read_bytes([filename]) for filename in files)
+    bits = np.array(text.replace(b",", b" ").split(), dtype=np.uint8).reshape(len(files), 32, 32)
+    return pack_bits(bits, "big")
+
+
+def write_csv(folder: str, key: str, frames: Frames) -> None:
+    for filename, bits in zip(output_files("csv", folder, key, len(frames)), unpack_bits(frames, "big")):
+        text = "\n".join(",".join("1" if bit else "0" for bit in row) for row in bits.tolist()) + "\n"
+        write_if_changed(filename, text.encode())
+
+
+def png_files(folder: str) -> Dict[str, List[str]]:
+    return {key: sh.sprite_files(key, num_frames, folder) for key, num_frames in sh.discover_sprites(folder).items()}
+
+
+def read_png(files: List[str]) -> Frames:
+    return np.stack([sh.load_sprite(filename).rows for filename in files])
+
+
+def write_png(folder: str, key: str, frames: Frames) -> None:
+    from PIL import Image
+
+    for filename, bits in zip(output_files("png", folder, key, len(frames)), unpack_bits(frames, "little")):
+        out = io.BytesIO()
+        Image.fromarray(np.where(bits, 0, 255).astype(np.uint8), mode="L").save(out, format="PNG")
+        write_if_changed(filename, out.getvalue())
+
+
+def output_files(dest_format: str, folder: str, key: str, num_frames: int) -> List[str]:
+    # The files a key's frames are written to, in frame order.
+    if dest_format == "csv":
+        return [os.path.join(folder, f"{name_of(key)}_{frame}.csv") for frame in range(1, num_frames + 1)]
+    path = os.path.join(folder, *key.split("/"))
+    if num_frames == 1:
+        return [path + ".png"]
+    return [os.path.join(path, f"{frame}.png") for frame in range(num_frames)]
+
+
+def output_hash(files: List[str]) -> Optional[str]:
+    # None when one of the files is missing.
+    try:
+        return hashlib.sha1(read_bytes(files)).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def write_if_changed(filename: str, data: bytes) -> bool:
+    # Unchanged files keep their mtime, which is what the sprite atlas checks for stale entries.
+    try:
+        with open(filename, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with open(filename, "wb") as f:
+        f.write(data)
+    return True
+
+
+def guess_format(path: str) -> str:
+    if path.endswith(".py"):
+        return "hex"
+    if os.path.isdir(path) and any(name.endswith(".csv") for name in os.listdir(path)):
+        return "csv"
+    return "png"
+
+
+def convert_key(fmt: str, files: List[str], dest_format: str, dest: str, key: str, transforms: List[str]) -> str:
+    # Runs in a worker process for csv and png sources, which are read there as well.
+    frames = (read_csv if fmt == "csv" else read_png)(files)
+    write_key(dest_format, dest, key, frames, transforms)
+    return key
+
+
+def write_key(dest_format: str, dest: str, key: str, frames: Frames, transforms: List[str]) -> None:
+    for name in transforms:
+        frames = TRANSFORMS[name](frames)
+    (write_csv if dest_format == "csv" else write_png)(dest, key, frames)
+
+
+def convert(
+    source: str,
+    dest: str,
+    fmt: Optional[str] = None,
+    dest_format: Optional[str] = None,
+    transforms: Optional[List[str]] = None,
+    force: bool = False,
+    workers: Optional[int] = None,
+) -> List[str]:
+    # Converts every sprite of source whose content hash changed since the last run into dest, spread
+    # over a process pool when there is more than one. Returns the keys that were converted.
+    fmt = fmt or guess_format(source)
+    dest_format = dest_format or guess_format(dest)
+    transforms = transforms or []
+    if fmt == "hex":
+        sources = read_hex(source)
+    else:
+        files = csv_files(source) if fmt == "csv" else png_files(source)
+        sources = {key: (None, read_bytes(names)) for key, names in files.items()}
+
+    if dest_format == "hex":
+        # A single module, written whole whenever it is converted to.
+        read = read_csv if fmt == "csv" else read_png
+        frames = {key: value if fmt == "hex" else read(files[key]) for key, (value, _) in sources.items()}
+        for name in transforms:
+            frames = {key: TRANSFORMS[name](value) for key, value in frames.items()}
+        write_hex(dest, frames)
+        return list(frames)
+
+    manifest_file = os.path.join(dest, MANIFEST)
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    hashes = {}
+    for key, (_, content) in sources.items():
+        digest = hashlib.sha1(content)
+        digest.update(f"\0{fmt}:{dest_format}:{','.join(transforms)}".encode())
+        hashes[key] = digest.hexdigest()
+    # Outputs that were deleted or edited since are converted again as well.
+    outputs = {
+        key: output_files(dest_format, dest, key, len(value) if fmt == "hex" else len(files[key]))
+        for key, (value, _) in sources.items()
+    }
+    todo = [key for key in sources if force or manifest.get(key) != [hashes[key], output_hash(outputs[key])]]
+
+    if fmt == "hex":
+        for key in todo:
+            write_key(dest_format, dest, key, sources[key][0], transforms)
+    elif len(todo) > 1 and workers != 1:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(convert_key, fmt, files[key], dest_format, dest, key, transforms) for key in todo]
+            for future in futures:
+                future.result()
+    else:
+        for key in todo:
+            convert_key(fmt, files[key], dest_format, dest, key, transforms)
+
+    manifest.update({key: [hashes[key], output_hash(outputs[key])] for key in todo})
+    os.makedirs(dest, exist_ok=True)
+    write_if_changed(manifest_file, json.dumps(manifest, indent=1, sort_keys=True).encode())
+    return todo
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert sprites between hex tuples, CSV files and the PNG tree.")
+    parser.add_argument("source", help="a .py module of hex tuples, a folder of CSVs or a sprite tree")
+    parser.add_argument("dest", help="where to write, a new folder becomes a sprite tree unless --to says otherwise")
+    parser.add_argument("--from", dest="fmt", choices=FORMATS)
+    parser.add_argument("--to", dest="dest_format", choices=FORMATS)
+    parser.add_argument("--transform", action="append", choices=sorted(TRANSFORMS), default=[], help="applied in order")
+    parser.add_argument("--force", action="store_true", help="convert every sprite, not just the changed ones")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-atlas", action="store_true", help="do not rebuild the sprite atlas after writing PNGs")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dest_format = args.dest_format or guess_format(args.dest)
+    converted = convert(args.source, args.dest, args.fmt, dest_format, args.transform, args.force, args.workers)
+    if converted and dest_format == "png" and not args.no_atlas and os.path.abspath(args.dest) == sh.sprite_folder:
+        sh.build_atlas()
+    print(f"{len(converted)} sprites converted in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
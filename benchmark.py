@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import os
+
+# Benchmarks never open a window, set before pygame is imported.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import numpy as np  # noqa: E402
+import platform  # noqa: E402
+import pygame  # noqa: E402
+import random  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+
+import simulation as sim  # noqa: E402
+import sprite_handler as sh  # noqa: E402
+import tamagotchi  # noqa: E402
+
+from typing import Callable, Dict, List  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, "benchmark_baseline.json")
+# A result is a regression once it is this much slower than the baseline.
+THRESHOLD = 0.2
+
+
+def timings(fn: Callable[[], object], repeat: int, warmup: int = 10) -> Dict[str, float]:
+    # Per-call times in milliseconds.
+    for _ in range(warmup):
+        fn()
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - start
+    times *= 1000
+    p50, p95, p99 = np.percentile(times, [50, 95, 99])
+    return {
+        "calls": repeat,
+        "mean_ms": float(times.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(times.max()),
+    }
+
+
+def in_subprocess(code: str, repeat: int) -> Dict[str, float]:
+    # Runs code in fresh interpreters, it prints the seconds it measured itself.
+    seconds = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout
+        seconds.append(float(output.split()[-1]))
+    return {"runs": repeat, "p50_ms": float(np.median(seconds) * 1000), "max_ms": float(max(seconds) * 1000)}
+
+
+def bench_render_display(repeat: int) -> Dict[str, float]:
+    screen = pygame.display.set_mode((tamagotchi.SCREEN_WIDTH, tamagotchi.SCREEN_HEIGHT), 0, 32)
+    frames = sh.IDLE_BABY
+    state = {"frame": 0}
+
+    def frame() -> None:
+        state["frame"] += 1
+        tamagotchi.render_display(
+            screen, frames[state["frame"] % len(frames)], tamagotchi.PIXEL_COLOR, tamagotchi.NONPIXEL_COLOR,
+            state["frame"] % 9 - 4,
+        )
+
+    return timings(frame, repeat)
+
+
+def bench_cached_display(repeat: int) -> Dict[str, float]:
+    # The same frames as render_display through the game's DisplayCache, once warm only blits remain.
+    screen = pygame.display.set_mode((tamagotchi.SCREEN_WIDTH, tamagotchi.SCREEN_HEIGHT), 0, 32)
+    cache = tamagotchi.DisplayCache()
+    pet = sim.PetSimulation(0)
+    pet.current_anim = "IDLE_BABY"
+    state = {"frame": 0}
+
+    def frame() -> None:
+        state["frame"] += 1
+        pet.frame = state["frame"] % len(sh.IDLE_BABY)
+        pet.off = state["frame"] % 9 - 4
+        screen.blit(cache.get(pet), tamagotchi.DISPLAY_RECT)
+
+    return timings(frame, repeat)
+
+
+def bench_render_component(repeat: int) -> Dict[str, float]:
+    surface = pygame.Surface((32, 32))
+    sprite = sh.FEED
+    return timings(
+        lambda: tamagotchi.render_component(surface, sprite, tamagotchi.PIXEL_COLOR, tamagotchi.NONPIXEL_COLOR),
+        repeat,
+    )
+
+
+def bench_compose_overlay(repeat: int) -> Dict[str, float]:
+    # Sprite and overlay OR'd together, shifted and unpacked, plus the progress bar.
+    sprite, overlay = sh.IDLE_CHILD[0], sh.OVERLAY_EXCLAIM[0]
+    return timings(lambda: tamagotchi.compose_display(sprite | overlay, 2, 12.5), repeat)
+
+
+def bench_do_cycle(repeat: int) -> Dict[str, float]:
+    pet = {"hunger": 0, "energy": 128, "waste": 0, "age": 0, "happiness": 0}
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        sim.do_cycle(pet, 1, rng)
+    return {"calls": repeat, "per_second": repeat / (time.perf_counter() - start)}
+
+
+def bench_ticks(repeat: int) -> Dict[str, float]:
+    # Whole game ticks of a pet that is kept fed, so it lives through the benchmark.
+    pet = sim.PetSimulation(0)
+    start = time.perf_counter()
+    for tick in range(repeat):
+        pet.tick()
+        if tick % 200 == 0:
+            pet.pet.update(hunger=0, age=0, energy=128)
+    return {"ticks": repeat, "per_second": repeat / (time.perf_counter() - start)}
+
+
+def bench_import_sprite_handler(repeat: int) -> Dict[str, float]:
+    return in_subprocess(
+        "import time; start = time.perf_counter(); import sprite_handler; sprite_handler.get('IDLE_EGG'); "
+        "print(time.perf_counter() - start)",
+        repeat,
+    )
+
+
+def bench_startup(repeat: int) -> Dict[str, float]:
+    # Imports, display setup and the first LCD frame as FAST_START does it, without the interpreter's own start.
+    return in_subprocess(
+        "import os, time; os.environ['SDL_VIDEODRIVER'] = 'dummy'; start = time.perf_counter(); "
+        "import pygame, tamagotchi; pygame.display.init(); pygame.font.init(); "
+        "screen = pygame.display.set_mode((tamagotchi.SCREEN_WIDTH, tamagotchi.SCREEN_HEIGHT), 0, 32); "
+        "tamagotchi.prebake_components(); screen.fill(tamagotchi.BG_COLOR); "
+        "tamagotchi.render_display(screen, tamagotchi.sh.IDLE_EGG[0], tamagotchi.PIXEL_COLOR, "
+        "tamagotchi.NONPIXEL_COLOR); pygame.display.update(); print(time.perf_counter() - start)",
+        repeat,
+    )
+
+
+BENCHMARKS: Dict[str, Callable[[int], Dict[str, float]]] = {
+    "render_display": bench_render_display,
+    "cached_display": bench_cached_display,
+    "render_component": bench_render_component,
+    "compose_overlay": bench_compose_overlay,
+    "do_cycle": bench_do_cycle,
+    "ticks": bench_ticks,
+    "import_sprite_handler": bench_import_sprite_handler,
+    "startup": bench_startup,
+}
+# Calls per benchmark at scale 1, subprocess benchmarks count interpreter launches.
+REPEATS = {
+    "render_display": 2000,
+    "cached_display": 2000,
+    "render_component": 5000,
+    "compose_overlay": 5000,
+    "do_cycle": 200000,
+    "ticks": 50000,
+    "import_sprite_handler": 5,
+    "startup": 5,
+}
+
+
+def run(names: List[str], scale: float = 1.0) -> Dict:
+    pygame.display.init()
+    results = {}
+    for name in names:
+        results[name] = BENCHMARKS[name](max(1, int(REPEATS[name] * scale)))
+    pygame.display.quit()
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pygame": pygame.version.ver,
+            "machine": platform.machine(),
+            "system": platform.system(),
+        },
+        "results": results,
+    }
+
+
+def regressions(report: Dict, baseline: Dict, threshold: float = THRESHOLD) -> List[str]:
+    # Medians have to stay within threshold of the baseline, throughputs must not drop by more.
+    found = []
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if "p50_ms" in result and "p50_ms" in base and result["p50_ms"] > base["p50_ms"] * (1 + threshold):
+            found.append(f"{name}: p50 {result['p50_ms']:.3f} ms, baseline {base['p50_ms']:.3f} ms")
+        if "per_second" in result and "per_second" in base and result["per_second"] < base["per_second"] / (
+            1 + threshold
+        ):
+            found.append(f"{name}: {result['per_second']:.0f}/s, baseline {base['per_second']:.0f}/s")
+    return found
+
+
+def print_report(report: Dict) -> None:
+    for name, result in report["results"].items():
+        if "per_second" in result:
+            print(f"{name:24} {result['per_second']:12.0f}/s")
+        else:
+            extra = "".join(f"  {key[:-3]} {result[key]:8.3f}" for key in ("p95_ms", "p99_ms") if key in result)
+            print(f"{name:24} p50 {result['p50_ms']:8.3f} ms{extra}  max {result['max_ms']:8.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark rendering, compositing, sprite loading and the simulation.")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run, all by default: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the number of calls")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    report = run(args.names or list(BENCHMARKS), args.scale)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        return
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.threshold)
+        for line in found:
+            print("REGRESSION", line)
+        sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
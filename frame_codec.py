@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import numpy as np
+import struct
+
+from sprite_handler import PackedSprite
+from typing import List
+
+# Every encoded frame starts with its kind and a sequence number that wraps at 256.
+#   KEYFRAME  kind, seq, the 32 rows as little-endian uint32
+#   DELTA     kind, seq, reference, shift, a uint32 mask of changed rows, then the changed rows as uint32
+#             XOR words against a recent frame shifted by shift columns. Reference 0 is the previous
+#             frame, 1 the one before, which is where two-frame animations come back to.
+#   SAME      kind, seq, the previous frame again
+KEYFRAME = 0
+DELTA = 1
+SAME = 2
+HEADER = struct.Struct("<BB")
+DELTA_HEADER = struct.Struct("<BBBbI")
+ROWS = struct.Struct("<32I")
+REFERENCES = 2
+# Offsets tried against each reference, the pet rarely moves more than a column or two per tick.
+SHIFTS = (0, -1, 1, -2, 2)
+
+
+def shifted(rows: np.ndarray, shift: int) -> np.ndarray:
+    return PackedSprite(rows).shift(shift).rows
+
+
+class FrameEncoder:
+    # Encodes a stream of LCD frames, each against the last one it encoded. A keyframe goes out first,
+    # every keyframe_interval frames after that and after keyframe() was called, e.g. for a new viewer.
+
+    def __init__(self, keyframe_interval: int = 60) -> None:
+        self.keyframe_interval = keyframe_interval
+        # Most recent frame first.
+        self.references: List[np.ndarray] = []
+        self.seq = 0
+        self.since_keyframe = 0
+
+    def keyframe(self) -> None:
+        self.references = []
+
+    def encode(self, frame) -> bytes:
+        rows = frame.rows if isinstance(frame, PackedSprite) else np.asarray(frame, dtype=np.uint32)
+        seq = self.seq
+        self.seq = (seq + 1) % 256
+        references = self.references
+        self.references = [rows.copy()] + references[:REFERENCES - 1]
+        if not references or self.since_keyframe >= self.keyframe_interval:
+            self.references = self.references[:1]
+            self.since_keyframe = 0
+            return HEADER.pack(KEYFRAME, seq) + ROWS.pack(*rows.tolist())
+        self.since_keyframe += 1
+        if np.array_equal(rows, references[0]):
+            return HEADER.pack(SAME, seq)
+        best = None
+        for reference, previous in enumerate(references):
+            for shift in SHIFTS:
+                xor = rows ^ shifted(previous, shift)
+                changed = np.flatnonzero(xor)
+                if best is None or len(changed) < len(best[2]):
+                    best = reference, shift, changed, xor
+        reference, shift, changed, xor = best
+        mask = sum(1 << row for row in changed.tolist())
+        return DELTA_HEADER.pack(DELTA, seq, reference, shift, mask) + xor[changed].astype("<u4").tobytes()
+
+
+class FrameDecoder:
+    # Rebuilds the frames of one FrameEncoder, decode() returns a sprite for render_display.
+    # Frames have to arrive in order, after a lost frame only a keyframe can be decoded again.
+
+    def __init__(self) -> None:
+        self.references: List[np.ndarray] = []
+        self.seq = 0
+
+    def decode(self, data: bytes) -> PackedSprite:
+        kind, seq = HEADER.unpack_from(data)
+        if kind == KEYFRAME:
+            self.references = []
+            rows = np.array(ROWS.unpack_from(data, HEADER.size), dtype=np.uint32)
+        elif not self.references or seq != (self.seq + 1) % 256:
+            self.references = []
+            raise ValueError("frame out of sequence, waiting for a keyframe")
+        elif kind == SAME:
+            rows = self.references[0]
+        elif kind == DELTA:
+            _, _, reference, shift, mask = DELTA_HEADER.unpack_from(data)
+            changed = [row for row in range(32) if mask >> row & 1]
+            rows = shifted(self.references[reference], shift)
+            rows[changed] ^= np.frombuffer(data, dtype="<u4", count=len(changed), offset=DELTA_HEADER.size)
+        else:
+            raise ValueError(f"unknown frame kind {kind}")
+        self.references = [rows] + self.references[:REFERENCES - 1]
+        self.seq = seq
+        return PackedSprite(rows.copy())
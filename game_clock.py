@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from simulation import ANIMATION_MS, TICK_MS
+from typing import List
+
+# Kinds of step the clock hands out.
+TICK = 0
+ANIMATION = 1
+
+
+class GameClock:
+    # Fixed-timestep clock: real time is scaled by time_scale and added to the game time, which is then
+    # used up in fixed steps of tick_ms for game ticks and animation_ms for animations. Steps always
+    # come in game time order, and when both are due at once the animation step goes first, the same
+    # order as PetSimulation.step().
+    # advance() hands out at most max_steps steps. Once it reaches that, the rest of the time passed is
+    # dropped and added to dropped_ms, so a long stall does not freeze the game in catch-up.
+
+    def __init__(
+        self,
+        tick_ms: int = TICK_MS,
+        animation_ms: int = ANIMATION_MS,
+        time_scale: float = 1.0,
+        max_steps: int = 250,
+    ) -> None:
+        self.tick_ms = tick_ms
+        self.animation_ms = animation_ms
+        self.time_scale = time_scale
+        self.max_steps = max_steps
+        # Game time in milliseconds and when the next step of each kind is due.
+        self.now = 0.0
+        self.next_tick = tick_ms
+        self.next_animation = animation_ms
+        self.dropped_ms = 0.0
+
+    def next_step(self) -> int:
+        # Moves the game time to the next step and returns its kind.
+        if self.next_animation <= self.next_tick:
+            self.now = self.next_animation
+            self.next_animation += self.animation_ms
+            return ANIMATION
+        self.now = self.next_tick
+        self.next_tick += self.tick_ms
+        return TICK
+
+    def advance(self, elapsed_ms: float) -> List[int]:
+        # Steps that fell due in elapsed_ms of real time, in order.
+        target = self.now + elapsed_ms * self.time_scale
+        steps = []
+        while min(self.next_tick, self.next_animation) <= target:
+            if len(steps) == self.max_steps:
+                self.dropped_ms += target - self.now
+                return steps
+            steps.append(self.next_step())
+        self.now = target
+        return steps
+
+    def until_next(self, animating: bool = True) -> float:
+        # Real milliseconds until the next step. Animation steps only count when something animates,
+        # the ones in between are caught up on with the next tick.
+        due = min(self.next_tick, self.next_animation) if animating else self.next_tick
+        return max(0.0, (due - self.now) / self.time_scale)
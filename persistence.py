@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import os
+import struct
+import tempfile
+import threading
+import time
+import warnings
+import zlib
+
+from simulation import DOWN, LEFT, RIGHT, PetSimulation
+from typing import List, Optional, Tuple
+
+# The save is a snapshot of the whole game state plus a journal of everything that happened since.
+SAVE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "save")
+SNAPSHOT_SUFFIX = ".snap"
+JOURNAL_SUFFIX = ".journal"
+
+SNAPSHOT_MAGIC = b"TMGS"
+SNAPSHOT_VERSION = 1
+# magic, version, sequence number of the last record it contains, wall-clock time, state length
+SNAPSHOT_HEADER = struct.Struct("<4sBQdH")
+# crc32 of the rest of the record, sequence number, wall-clock time, kind, payload length
+RECORD_HEADER = struct.Struct("<IQdBB")
+CRC = struct.Struct("<I")
+
+# Journal record kinds, a tick carries the state after it, a press the button. Snapshots only pass
+# through the write queue.
+SNAPSHOT = 0
+TICK = 1
+PRESS = 2
+BUTTON_CODES = {LEFT: 0, DOWN: 1, RIGHT: 2}
+BUTTON_NAMES = {code: button for button, code in BUTTON_CODES.items()}
+
+# hunger, energy, waste, age, happiness, ticks, off, selid, spid, stage, frame, ol_frame, flags
+STATE = struct.Struct("<5iqbiiBHHB")
+FLAGS = ("stats", "has_overlay", "cleaning", "eating", "sleeping", "dead")
+ANIMATIONS = ("current_anim", "overlay_anim", "stats_page")
+
+
+def pack_state(sim: PetSimulation) -> bytes:
+    flags = sum(getattr(sim, flag) << bit for bit, flag in enumerate(FLAGS))
+    state = STATE.pack(
+        *(sim.pet[stat] for stat in ("hunger", "energy", "waste", "age", "happiness")),
+        sim.ticks, sim.off, sim.selid, sim.spid, sim.stage, sim.frame, sim.ol_frame, flags,
+    )
+    # Animations are stored by their sprite_handler name, each prefixed with its length.
+    names = b"".join(bytes([len(name)]) + name.encode() for name in (getattr(sim, attr) for attr in ANIMATIONS))
+    return state + names
+
+
+def unpack_state(data: bytes, sim: PetSimulation) -> None:
+    values = STATE.unpack_from(data)
+    for stat, value in zip(("hunger", "energy", "waste", "age", "happiness"), values):
+        sim.pet[stat] = value
+    sim.ticks, sim.off, sim.selid, sim.spid, sim.stage, sim.frame, sim.ol_frame, flags = values[5:]
+    for bit, flag in enumerate(FLAGS):
+        setattr(sim, flag, bool(flags >> bit & 1))
+    pos = STATE.size
+    for attr in ANIMATIONS:
+        length = data[pos]
+        setattr(sim, attr, data[pos + 1:pos + 1 + length].decode())
+        pos += 1 + length
+
+
+def read_snapshot(filename: str) -> Optional[Tuple[int, float, bytes]]:
+    # Returns the sequence number, time and state of a valid snapshot, None if it is missing or damaged.
+    try:
+        with open(filename, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < SNAPSHOT_HEADER.size + CRC.size or CRC.unpack_from(data, len(data) - CRC.size)[0] != zlib.crc32(
+        data[:-CRC.size]
+    ):
+        return None
+    magic, version, seq, saved_at, length = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    return seq, saved_at, data[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + length]
+
+
+def write_snapshot(filename: str, seq: int, saved_at: float, state: bytes) -> None:
+    data = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, seq, saved_at, len(state)) + state
+    # Written next to the target and renamed, so a crash leaves either the old or the new snapshot.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=SNAPSHOT_SUFFIX)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data + CRC.pack(zlib.crc32(data)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+def pack_record(seq: int, saved_at: float, kind: int, payload: bytes) -> bytes:
+    body = RECORD_HEADER.pack(0, seq, saved_at, kind, len(payload))[CRC.size:] + payload
+    return CRC.pack(zlib.crc32(body)) + body
+
+
+def read_journal(filename: str) -> Tuple[List[Tuple[int, float, int, bytes]], int]:
+    # Returns the intact records and the length of the journal they span. Reading stops at the first
+    # short or damaged record, which is what a crash in the middle of a write leaves behind.
+    try:
+        with open(filename, "rb") as f:
+            data = f.read()
+    except OSError:
+        return [], 0
+    records = []
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(data):
+        crc, seq, saved_at, kind, length = RECORD_HEADER.unpack_from(data, pos)
+        end = pos + RECORD_HEADER.size + length
+        if end > len(data) or zlib.crc32(data[pos + CRC.size:end]) != crc:
+            break
+        records.append((seq, saved_at, kind, data[pos + RECORD_HEADER.size:end]))
+        pos = end
+    return records, pos
+
+
+class SaveStore:
+    # Keeps a PetSimulation on disk. Every tick and key press is appended to the journal, and every
+    # compact_every records the state is written as a new snapshot and the journal starts over.
+    # Records are only queued by the game loop, a background thread writes and fsyncs them in batches
+    # every flush_interval seconds.
+
+    def __init__(self, path: str = SAVE_FILE, flush_interval: float = 1.0, compact_every: int = 3600) -> None:
+        self.snapshot_file = path + SNAPSHOT_SUFFIX
+        self.journal_file = path + JOURNAL_SUFFIX
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.seq = 0
+        self.records = 0
+        self.saved_at = 0.0
+        # (kind, sequence number, time, data) in the order they were queued.
+        self.pending: List[Tuple[int, int, float, bytes]] = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closing = False
+        # The last write that failed, None once a flush succeeds again.
+        self.error: Optional[OSError] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def restore(self) -> Optional[PetSimulation]:
+        # Loads the snapshot and replays the journal on top of it, returns None when there is no save.
+        # saved_at is left at the time of the last record, so the caller can catch up on the time since.
+        sim = PetSimulation()
+        found = False
+        snapshot = read_snapshot(self.snapshot_file)
+        if snapshot is not None:
+            self.seq, self.saved_at, state = snapshot
+            unpack_state(state, sim)
+            found = True
+        records, length = read_journal(self.journal_file)
+        for seq, saved_at, kind, payload in records:
+            # A crash between writing a snapshot and emptying the journal leaves records it already has.
+            if seq <= self.seq:
+                continue
+            if kind == TICK:
+                unpack_state(payload, sim)
+            elif kind == PRESS:
+                sim.press(BUTTON_NAMES[payload[0]])
+            self.seq, self.saved_at = seq, saved_at
+            self.records += 1
+            found = True
+        if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file) > length:
+            # New records must not end up behind a torn one.
+            with open(self.journal_file, "r+b") as f:
+                f.truncate(length)
+        return sim if found else None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def record_tick(self, sim: PetSimulation) -> None:
+        self.append(TICK, pack_state(sim))
+        if self.records >= self.compact_every:
+            self.snapshot(sim)
+
+    def record_press(self, button: str) -> None:
+        self.append(PRESS, bytes([BUTTON_CODES[button]]))
+
+    def append(self, kind: int, payload: bytes) -> None:
+        self.seq += 1
+        self.records += 1
+        self.saved_at = time.time()
+        with self.lock:
+            self.pending.append((kind, self.seq, self.saved_at, pack_record(self.seq, self.saved_at, kind, payload)))
+
+    def snapshot(self, sim: PetSimulation) -> None:
+        self.records = 0
+        self.saved_at = time.time()
+        with self.lock:
+            self.pending.append((SNAPSHOT, self.seq, self.saved_at, pack_state(sim)))
+        self.wake.set()
+
+    def close(self, sim: Optional[PetSimulation] = None) -> None:
+        # Writes a final snapshot of sim if given, then waits until everything queued is on disk.
+        if sim is not None:
+            self.snapshot(sim)
+        self.closing = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+        else:
+            self.flush()
+
+    def run(self) -> None:
+        while not self.closing:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return
+        try:
+            with open(self.journal_file, "ab") as f:
+                for kind, seq, saved_at, data in pending:
+                    if kind != SNAPSHOT:
+                        f.write(data)
+                        continue
+                    # The journal up to here is covered by the snapshot once it is in place.
+                    write_snapshot(self.snapshot_file, seq, saved_at, data)
+                    f.truncate(0)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as exc:
+            # Everything goes back on the queue for the next flush. Records that did reach the journal
+            # are skipped by restore() the second time, as their sequence numbers are not new.
+            with self.lock:
+                self.pending[:0] = pending
+            if self.error is None:
+                warnings.warn(f"cannot save to {self.journal_file}: {exc}")
+            self.error = exc
+        else:
+            self.error = None
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import numpy as np
+
+import simulation as sim
+import sprite_handler as sh
+
+from population import CYCLE_DELTAS, DRAWS, OFFSET_STEPS
+from simulation import PetSimulation
+from typing import Iterator, Optional
+
+# Animations are stored per pet as an index into ANIMATIONS.
+ANIMATIONS = tuple(sh.SPRITES)
+ANIMATION_IDS = {name: i for i, name in enumerate(ANIMATIONS)}
+FRAME_COUNTS = np.array([num_frames for _, num_frames, _ in sh.SPRITES.values()], dtype=np.int8)
+FRAME_CYCLES = np.array([sim.frame_cycle(name) for name in ANIMATIONS], dtype=np.int8)
+IDLE_BY_STAGE = np.array([ANIMATION_IDS[name] for name in ("IDLE_EGG", "IDLE_BABY", "IDLE_CHILD")], dtype=np.uint8)
+# As in trigger_sleep and trigger_death, an egg never gets to sleep or die.
+SLEEP_BY_STAGE = np.array(
+    [ANIMATION_IDS[name] for name in ("SLEEP_BABY", "SLEEP_BABY", "SLEEP_CHILD")], dtype=np.uint8
+)
+STATS = ("hunger", "energy", "waste", "age", "happiness")
+
+
+def frame_table() -> np.ndarray:
+    # Rows of every frame of every animation, indexed [animation, frame], one read-only copy shared by
+    # all pets of all hosts. Components sit in frame 0.
+    table = np.zeros((len(ANIMATIONS), int(FRAME_COUNTS.max()), 32), dtype=np.uint32)
+    for i, name in enumerate(ANIMATIONS):
+        frames = sh.get(name)
+        for frame, sprite in enumerate(frames if isinstance(frames, list) else [frames]):
+            table[i, frame] = sprite.rows
+    table.setflags(write=False)
+    return table
+
+
+_frames: Optional[np.ndarray] = None
+
+
+def frames() -> np.ndarray:
+    global _frames
+    if _frames is None:
+        _frames = frame_table()
+    return _frames
+
+
+def field(name: str, kind: type = int) -> property:
+    def get(self: Pet):
+        return kind(getattr(self.host, name)[self.index])
+
+    def set(self: Pet, value) -> None:
+        getattr(self.host, name)[self.index] = value
+
+    return property(get, set)
+
+
+def animation(name: str) -> property:
+    def get(self: Pet) -> str:
+        return ANIMATIONS[getattr(self.host, name)[self.index]]
+
+    def set(self: Pet, value: str) -> None:
+        getattr(self.host, name)[self.index] = ANIMATION_IDS[value]
+
+    return property(get, set)
+
+
+class PetStats:
+    # The pet dict of a PetSimulation, backed by the host's arrays.
+    __slots__ = ("host", "index")
+
+    def __init__(self, host: PetHost, index: int) -> None:
+        self.host = host
+        self.index = index
+
+    def __getitem__(self, stat: str) -> int:
+        return int(getattr(self.host, stat)[self.index])
+
+    def __setitem__(self, stat: str, value: int) -> None:
+        getattr(self.host, stat)[self.index] = value
+
+    def keys(self) -> tuple:
+        return STATS
+
+    def values(self) -> list:
+        return [self[stat] for stat in STATS]
+
+
+class Pet:
+    # One pet of a PetHost, a view with the attributes of a PetSimulation. Views are made on demand and
+    # hold nothing but the host and index, the state itself lives in the host's arrays.
+    __slots__ = ("host", "index")
+
+    def __init__(self, host: PetHost, index: int) -> None:
+        self.host = host
+        self.index = index
+
+    @property
+    def pet(self) -> PetStats:
+        return PetStats(self.host, self.index)
+
+    @property
+    def ticks(self) -> int:
+        return self.host.ticks
+
+    off = field("off")
+    selid = field("selid")
+    spid = field("spid")
+    stage = field("stage")
+    frame = field("frame")
+    ol_frame = field("ol_frame")
+    stats = field("stats", bool)
+    has_overlay = field("has_overlay", bool)
+    cleaning = field("cleaning", bool)
+    eating = field("eating", bool)
+    sleeping = field("sleeping", bool)
+    dead = field("dead", bool)
+    current_anim = animation("current_anim")
+    overlay_anim = animation("overlay_anim")
+    stats_page = animation("stats_page")
+
+    # Key presses and the LCD contents work exactly as for a single pet.
+    press = PetSimulation.press
+    progress = PetSimulation.progress
+    display_key = PetSimulation.display_key
+    display = PetSimulation.display
+    overlay_frame = PetSimulation.overlay_frame
+
+
+class PetHost:
+    # Many complete pets in one set of arrays, one entry per pet and field: about 40 bytes a pet.
+    # tick() and animate() follow PetSimulation.tick and PetSimulation.animate for all pets at once,
+    # drawing from do_cycle's and get_offset's distributions with NumPy like Population does.
+
+    def __init__(self, n: int, seed: Optional[int] = None) -> None:
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.ticks = 0
+        self.steps = 0
+
+        # Tamagotchi
+        self.hunger = np.zeros(n, dtype=np.int32)
+        self.energy = np.full(n, 8, dtype=np.int32)
+        self.waste = np.zeros(n, dtype=np.int32)
+        self.age = np.zeros(n, dtype=np.int32)
+        self.happiness = np.zeros(n, dtype=np.int32)
+
+        # Counters
+        self.off = np.zeros(n, dtype=np.int8)
+        self.selid = np.zeros(n, dtype=np.int32)
+        self.spid = np.zeros(n, dtype=np.int8)
+        self.stage = np.zeros(n, dtype=np.int8)
+        self.frame = np.zeros(n, dtype=np.int8)
+        self.ol_frame = np.zeros(n, dtype=np.int8)
+
+        # Flags
+        self.stats = np.zeros(n, dtype=bool)
+        self.has_overlay = np.zeros(n, dtype=bool)
+        self.cleaning = np.zeros(n, dtype=bool)
+        self.eating = np.zeros(n, dtype=bool)
+        self.sleeping = np.zeros(n, dtype=bool)
+        self.dead = np.zeros(n, dtype=bool)
+
+        self.current_anim = np.full(n, ANIMATION_IDS["IDLE_EGG"], dtype=np.uint8)
+        self.overlay_anim = np.full(n, ANIMATION_IDS["OVERLAY_ZZZ"], dtype=np.uint8)
+        self.stats_page = np.full(n, ANIMATION_IDS["DISPLAY_HUNGER"], dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, index: int) -> Pet:
+        if not -self.n <= index < self.n:
+            raise IndexError(index)
+        return Pet(self, index % self.n)
+
+    def __iter__(self) -> Iterator[Pet]:
+        return (Pet(self, index) for index in range(self.n))
+
+    def bytes_per_pet(self) -> int:
+        return sum(value.itemsize for value in vars(self).values() if isinstance(value, np.ndarray))
+
+    def press(self, index: int, button: str) -> None:
+        self[index].press(button)
+
+    def step(self, n_ticks: int = 1) -> None:
+        for _ in range(n_ticks):
+            for _ in range(sim.TICK_MS // sim.ANIMATION_MS):
+                self.animate()
+            self.tick()
+
+    def animate(self) -> None:
+        self.steps += 1
+        self.off -= self.cleaning
+        cleaned = self.cleaning & (self.off == -33)
+        self.off *= ~cleaned
+        self.waste *= ~cleaned
+        self.cleaning &= ~cleaned
+        self.has_overlay &= ~cleaned
+
+    def tick(self) -> None:
+        self.ticks += 1
+
+        hatch = (self.stage == 0) & (self.age > sim.AGE_HATCH)
+        self.stage += hatch
+        self.current_anim[hatch] = ANIMATION_IDS["IDLE_BABY"]
+        self.has_overlay &= ~hatch
+        grow = (self.stage == 1) & (self.age > sim.AGE_CHILD)
+        self.stage += grow
+        self.current_anim[grow] = ANIMATION_IDS["IDLE_CHILD"]
+
+        done = self.eating & (self.ol_frame == FRAME_CYCLES[self.overlay_anim] - 1)
+        self.eating &= ~done
+        self.has_overlay &= ~done
+        self.ol_frame *= ~done
+        self.hunger *= ~done
+
+        self.energy += self.sleeping * np.int32(8)
+        woke = self.sleeping & (self.energy >= 256)
+        self.sleeping &= ~woke
+        self.has_overlay &= ~woke
+        self.current_anim = np.where(woke, IDLE_BY_STAGE[self.stage], self.current_anim)
+
+        active = ~(self.cleaning | self.dead)
+        self.frame = np.where(active, (self.frame + 1) % FRAME_COUNTS[self.current_anim], self.frame)
+        draw = self.rng.integers(0, DRAWS, self.n, dtype=np.uint16)
+        region = (self.off >= -3).view(np.int8) + (self.off > 3)
+        self.off += OFFSET_STEPS.take(draw + region * np.int32(DRAWS)) * active
+        self.age += active * np.int32(2)
+        grown = active & (self.stage != 0)
+        deltas = CYCLE_DELTAS.take(draw + ~grown * np.int32(DRAWS)).view(np.int8).reshape(self.n, 4)
+        self.hunger += deltas[:, 0]
+        self.energy += deltas[:, 1]
+        self.waste += deltas[:, 2]
+        self.happiness += deltas[:, 3]
+        self.happiness -= grown & (self.waste >= sim.WASTE_EXPUNGE)
+        passout = grown & (self.energy < sim.ENERGY_PASSOUT)
+        self.happiness -= passout * np.int32(64)
+        self.sleep_or_die(passout, ANIMATION_IDS["OVERLAY_ZZZ"])
+        self.sleeping |= passout
+
+        idle = ~(self.sleeping | self.cleaning | self.eating | self.dead)
+        stink = idle & (self.waste >= sim.WASTE_EXPUNGE)
+        exclaim = idle & ~stink & (
+            (self.energy <= sim.ENERGY_TIRED)
+            | (self.hunger >= sim.HUNGER_NEEDSTOEAT)
+            | (self.waste >= sim.WASTE_EXPUNGE - sim.WASTE_EXPUNGE / 3)
+        )
+        self.overlay_anim[stink] = ANIMATION_IDS["OVERLAY_STINK"]
+        self.overlay_anim[exclaim] = ANIMATION_IDS["OVERLAY_EXCLAIM"]
+        self.has_overlay |= stink | exclaim
+        died = idle & (
+            (self.hunger >= sim.HUNGER_DEADFROMNOTEATING) | (self.age >= sim.AGE_DEATHFROMNATURALCAUSES)
+        )
+        self.off[died] = 3
+        self.sleep_or_die(died, ANIMATION_IDS["OVERLAY_DEAD"])
+        self.dead |= died
+
+        self.ol_frame = np.where(
+            self.has_overlay, (self.ol_frame + 1) % FRAME_CYCLES[self.overlay_anim], self.ol_frame
+        )
+
+    def sleep_or_die(self, which: np.ndarray, overlay: int) -> None:
+        self.current_anim = np.where(which, SLEEP_BY_STAGE[self.stage], self.current_anim)
+        self.overlay_anim[which] = overlay
+        self.has_overlay |= which
+
+    def progress(self, index: np.ndarray) -> np.ndarray:
+        # PetSimulation.progress of the given pets.
+        index = np.asarray(index, dtype=np.intp)
+        spid = self.spid[index]
+        percv = np.select(
+            [spid == 0, spid == 1, spid == 2, spid == 3],
+            [
+                self.hunger[index] * 27 / sim.HUNGER_NEEDSTOEAT,
+                self.age[index] * 27 / sim.AGE_DEATHFROMNATURALCAUSES,
+                (self.waste[index] % sim.WASTE_EXPUNGE) * 27 / sim.WASTE_EXPUNGE,
+                self.energy[index] * 27 / 256,
+            ],
+            0.0,
+        )
+        return np.minimum(percv, 27)
+
+    def compose(self, index: np.ndarray) -> np.ndarray:
+        # LCD rows of the given pets, like compose_display of their display(), shape (len(index), 32).
+        index = np.asarray(index, dtype=np.intp)
+        table = frames()
+        rows = table[self.current_anim[index], self.frame[index]]
+        overlays = self.overlay_anim[index]
+        rows |= table[overlays, self.ol_frame[index] % FRAME_COUNTS[overlays]] * self.has_overlay[index, None]
+        off = self.off[index].astype(np.int64)[:, None]
+        shifted = np.where(off >= 0, rows >> np.clip(off, 0, 31), rows << np.clip(-off, 0, 31))
+        rows = np.where(abs(off) >= 32, np.uint32(0), shifted).astype(np.uint32)
+        stats = self.stats[index]
+        if stats.any():
+            # Stats pages are not shifted and carry the progress bar on rows 12 to 16.
+            width = np.minimum(32, np.ceil(3 + self.progress(index[stats]))).astype(np.uint64)
+            bar = np.where(width > 3, (np.uint64(1) << width) - np.uint64(8), np.uint64(0)).astype(np.uint32)
+            pages = table[self.stats_page[index[stats]], 0].copy()
+            pages[:, 12:17] |= bar[:, None]
+            rows[stats] = pages
+        return rows
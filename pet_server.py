@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+
+import numpy as np
+
+import simulation as sim
+
+from frame_codec import FrameEncoder
+from game_clock import ANIMATION, GameClock
+from pet_host import STATS, PetHost
+from simulation import DOWN, LEFT, RIGHT
+from typing import Dict, List, Optional, Set, Tuple
+
+# Line protocol, one command per line, pets are numbered from 0:
+#   FEED <pet>, CLEAN <pet>, SLEEP <pet>      select the button and press it
+#   STATS <pet> [page]                        show the stats, or page 0 to 4 of them
+#   BACK <pet>                                leave the stats
+#   PRESS <pet> left|down|right               press a button
+#   GET <pet>                                 reply with all fields
+#   SUBSCRIBE <pet> [frames]                  stream changed fields after every game step, and the LCD
+#   UNSUBSCRIBE <pet>
+# Every line sent back is a JSON object with a "type" of ok, error, state, delta or frame. The "data" of a
+# frame is the LCD encoded by a frame_codec.FrameEncoder, in base64. Each subscription has its own
+# encoder and starts with a keyframe, feed the frames of a pet to one FrameDecoder in the order received.
+FIELDS = (
+    "hunger",
+    "energy",
+    "waste",
+    "age",
+    "happiness",
+    "stage",
+    "off",
+    "frame",
+    "stats",
+    "sleeping",
+    "eating",
+    "cleaning",
+    "dead",
+    "current_anim",
+    "overlay_anim",
+    "has_overlay",
+)
+BUTTONS = {"left": LEFT, "down": DOWN, "right": RIGHT}
+# Button each command selects before pressing down, as the FEED, FLUSH, HEALTH and ZZZ icons.
+SELECTIONS = {"FEED": 0, "CLEAN": 1, "STATS": 2, "SLEEP": 3}
+# Bytes a client may have waiting to be sent before its updates are held back and merged.
+HIGH_WATER = 64 * 1024
+
+
+class Client:
+    # One connection. While its socket keeps up every update is written right away, otherwise the
+    # deltas are merged per pet and only the latest frame is kept, so a slow client costs bounded memory.
+    # Frames are encoded as they are written, so the ones held back never reach the encoders. Held updates
+    # go out as soon as the socket has drained, whether or not the pet changes again.
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.subscriptions: Dict[int, bool] = {}
+        self.encoders: Dict[int, FrameEncoder] = {}
+        self.held_deltas: Dict[int, Dict[str, object]] = {}
+        self.held_frames: Dict[int, np.ndarray] = {}
+        # Tick of the latest update held back, and the task waiting to send it.
+        self.held_tick = 0
+        self.drainer: Optional[asyncio.Task] = None
+
+    def send(self, message: Dict[str, object]) -> None:
+        self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+    def backed_up(self) -> bool:
+        return self.writer.transport.get_write_buffer_size() > HIGH_WATER
+
+    def subscribe(self, pet: int, frames: bool, rows: np.ndarray) -> None:
+        self.subscriptions[pet] = frames
+        self.held_deltas.pop(pet, None)
+        self.held_frames.pop(pet, None)
+        self.encoders.pop(pet, None)
+        if frames:
+            self.encoders[pet] = FrameEncoder()
+            self.held_frames[pet] = rows
+
+    def unsubscribe(self, pet: int) -> None:
+        self.subscriptions.pop(pet, None)
+        self.held_deltas.pop(pet, None)
+        self.held_frames.pop(pet, None)
+        self.encoders.pop(pet, None)
+
+    def publish(self, tick: int, deltas: Dict[int, Dict[str, object]], frames: Dict[int, np.ndarray]) -> None:
+        for pet, frames_wanted in self.subscriptions.items():
+            if pet in deltas:
+                self.held_deltas.setdefault(pet, {}).update(deltas[pet])
+            if frames_wanted and pet in frames:
+                self.held_frames[pet] = frames[pet]
+        self.flush(tick)
+
+    def flush(self, tick: int) -> None:
+        self.held_tick = tick
+        if self.backed_up():
+            if self.drainer is None:
+                self.drainer = asyncio.get_running_loop().create_task(self.drain())
+            return
+        for pet, changes in self.held_deltas.items():
+            self.send({"type": "delta", "pet": pet, "tick": tick, "changes": changes})
+        for pet, rows in self.held_frames.items():
+            data = base64.b64encode(self.encoders[pet].encode(rows)).decode()
+            self.send({"type": "frame", "pet": pet, "tick": tick, "data": data})
+        self.held_deltas.clear()
+        self.held_frames.clear()
+
+    async def drain(self) -> None:
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            return
+        finally:
+            self.drainer = None
+        self.flush(self.held_tick)
+
+    def close(self) -> None:
+        if self.drainer is not None:
+            self.drainer.cancel()
+        self.writer.close()
+
+
+class PetServer:
+    # Hosts a PetHost on the game clock and serves it to any number of line protocol clients.
+
+    def __init__(self, pets: int = 1024, seed: Optional[int] = None, time_scale: float = 1.0) -> None:
+        self.host = PetHost(pets, seed)
+        self.clock = GameClock(time_scale=time_scale)
+        self.clients: Set[Client] = set()
+        # Fields and LCD rows each subscribed pet was last published with.
+        self.published: Dict[int, Tuple] = {}
+        self.shown: Dict[int, np.ndarray] = {}
+
+    def state(self, pet: int) -> Dict[str, object]:
+        view = self.host[pet]
+        stats = view.pet
+        return {name: stats[name] if name in STATS else getattr(view, name) for name in FIELDS}
+
+    def command(self, client: Client, line: str) -> Dict[str, object]:
+        words = line.split()
+        if not words:
+            raise ValueError("empty command")
+        name, args = words[0].upper(), words[1:]
+        if not args or not args[0].isdigit() or int(args[0]) >= len(self.host):
+            raise ValueError(f"expected a pet number below {len(self.host)}")
+        pet = int(args[0])
+        view = self.host[pet]
+        # Arguments are checked before any button is pressed, so a bad command leaves the pet as it was.
+        page = None
+        if name == "STATS" and len(args) > 1:
+            if not args[1].isdigit():
+                raise ValueError("expected a stats page from 0 to 4")
+            page = int(args[1]) % 5
+        if name == "PRESS" and (len(args) < 2 or args[1].lower() not in BUTTONS):
+            raise ValueError("expected left, down or right")
+        if name in SELECTIONS and not (name == "STATS" and view.stats):
+            view.selid = SELECTIONS[name]
+            view.press(DOWN)
+        if page is not None:
+            view.spid = page
+            view.stats_page = sim.update_page(view.spid)
+        elif name == "BACK":
+            if view.stats:
+                view.selid = SELECTIONS["STATS"]
+                view.press(DOWN)
+        elif name == "PRESS":
+            view.press(BUTTONS[args[1].lower()])
+        elif name == "GET":
+            return {"type": "state", "pet": pet, "tick": self.host.ticks, "state": self.state(pet)}
+        elif name == "SUBSCRIBE":
+            # The first frame goes out with the next flush, right after this reply.
+            client.subscribe(pet, len(args) > 1 and args[1].lower() == "frames", self.host.compose([pet])[0])
+            return {"type": "state", "pet": pet, "tick": self.host.ticks, "state": self.state(pet)}
+        elif name == "UNSUBSCRIBE":
+            client.unsubscribe(pet)
+        elif name not in SELECTIONS:
+            raise ValueError(f"unknown command {name}")
+        return {"type": "ok", "pet": pet}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = Client(writer)
+        self.clients.add(client)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than the stream limit, where the next command starts is lost as well.
+                    client.send({"type": "error", "message": "line too long"})
+                    break
+                if not line:
+                    break
+                try:
+                    client.send(self.command(client, line.decode(errors="replace")))
+                except ValueError as exc:
+                    client.send({"type": "error", "message": str(exc)})
+                client.flush(self.host.ticks)
+                if client.backed_up():
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            client.close()
+
+    def changes(self) -> Tuple[Dict[int, Dict[str, object]], Dict[int, np.ndarray]]:
+        # Fields of subscribed pets that changed since they were last published, and the LCD rows of those
+        # whose picture changed. The rows are compared on their own, the overlay frame and stats page that
+        # also change the picture are not among FIELDS.
+        subscribed: Dict[int, bool] = {}
+        for client in self.clients:
+            for pet, frames in client.subscriptions.items():
+                subscribed[pet] = subscribed.get(pet, False) or frames
+        deltas = {}
+        for pet in subscribed:
+            state = self.state(pet)
+            values = tuple(state.values())
+            last = self.published.get(pet)
+            if last != values:
+                deltas[pet] = {
+                    name: value for i, (name, value) in enumerate(state.items()) if last is None or last[i] != value
+                }
+                self.published[pet] = values
+        for pet in set(self.published) - set(subscribed):
+            del self.published[pet]
+        framed = [pet for pet in subscribed if subscribed[pet]]
+        frames = {}
+        for pet, rows in zip(framed, self.host.compose(framed) if framed else []):
+            if pet not in self.shown or not np.array_equal(self.shown[pet], rows):
+                frames[pet] = self.shown[pet] = rows
+        for pet in set(self.shown) - set(framed):
+            del self.shown[pet]
+        return deltas, frames
+
+    async def run_clock(self) -> None:
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        while True:
+            # Animation steps only need their own wake-up while some pet is cleaning.
+            await asyncio.sleep(self.clock.until_next(bool(self.host.cleaning.any())) / 1000)
+            now = loop.time()
+            steps = self.clock.advance((now - last) * 1000)
+            last = now
+            for step in steps:
+                if step == ANIMATION:
+                    self.host.animate()
+                else:
+                    self.host.tick()
+            if steps and self.clients:
+                deltas, frames = self.changes()
+                if deltas or frames:
+                    for client in list(self.clients):
+                        client.publish(self.host.ticks, deltas, frames)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 7450, unix: Optional[str] = None) -> None:
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, backlog=4096)
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.run_clock())
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve pets over a line protocol on a TCP or Unix socket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7450)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--pets", type=int, default=1024)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    args = parser.parse_args(argv)
+    server = PetServer(args.pets, args.seed, args.time_scale)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import numpy as np
+import pygame
+import sys
+
+from pygame.locals import KEYDOWN, K_DOWN, K_LEFT, K_PAGEDOWN, K_PAGEUP, K_RIGHT, MOUSEBUTTONDOWN, QUIT
+
+import game_clock
+
+from pet_host import PetHost
+from tamagotchi import BG_COLOR, BUTTONS, NONPIXEL_COLOR, PIXEL_COLOR
+from typing import List, Optional
+
+# A wall of COLUMNS x ROWS LCDs, each LCD pixel drawn as SCALE x SCALE screen pixels.
+PETS = 4096
+COLUMNS = 8
+ROWS = 8
+SCALE = 3
+GAP = 4
+
+
+class PetWall:
+    # Draws one page of a host's pets as a grid of tiles. A tile is only drawn again when the LCD rows
+    # it shows changed, pets on other pages are not even composed.
+
+    def __init__(self, host: PetHost, columns: int = COLUMNS, rows: int = ROWS, scale: int = SCALE) -> None:
+        self.host = host
+        self.columns = columns
+        self.rows = rows
+        self.scale = scale
+        self.pitch = 32 * scale + GAP
+        self.first = 0
+        self.selected = 0
+        # Pet whose tile carries the selection frame on screen.
+        self.marked: Optional[int] = None
+        # LCD rows each tile was last drawn with, None until the first frame of a page.
+        self.drawn: Optional[np.ndarray] = None
+        self.palette = np.array([NONPIXEL_COLOR, PIXEL_COLOR], dtype=np.uint8)
+
+    def size(self) -> tuple:
+        return self.columns * self.pitch + GAP, self.rows * self.pitch + GAP
+
+    def visible(self) -> np.ndarray:
+        return np.arange(self.first, min(self.first + self.columns * self.rows, len(self.host)))
+
+    def tile_rect(self, tile: int) -> pygame.Rect:
+        x = GAP + tile % self.columns * self.pitch
+        y = GAP + tile // self.columns * self.pitch
+        return pygame.Rect(x, y, 32 * self.scale, 32 * self.scale)
+
+    def tile_at(self, pos: tuple) -> Optional[int]:
+        column, row = (pos[0] - GAP) // self.pitch, (pos[1] - GAP) // self.pitch
+        if 0 <= column < self.columns and 0 <= row < self.rows:
+            index = self.first + row * self.columns + column
+            if index < len(self.host):
+                return index
+        return None
+
+    def scroll(self, pages: int) -> None:
+        per_page = self.columns * self.rows
+        last = (len(self.host) - 1) // per_page * per_page
+        self.first = min(max(0, self.first + pages * per_page), last)
+        self.drawn = None
+
+    def frame_rect(self, index: Optional[int]) -> Optional[pygame.Rect]:
+        # The selection frame around a pet's tile, in the gap around it. None for pets on other pages.
+        if index is None or not self.first <= index < self.first + len(self.visible()):
+            return None
+        return self.tile_rect(index - self.first).inflate(GAP, GAP)
+
+    def render(self, screen: pygame.Surface) -> List[pygame.Rect]:
+        visible = self.visible()
+        rows = self.host.compose(visible)
+        full = self.drawn is None or len(self.drawn) != len(rows)
+        if full:
+            # A new page, the gaps and the tiles a shorter last page leaves empty are cleared as well.
+            screen.fill(BG_COLOR)
+            changed = np.arange(len(rows))
+            self.marked = None
+        else:
+            changed = np.flatnonzero((rows != self.drawn).any(axis=1))
+        self.drawn = rows
+        dirty = []
+        if changed.size:
+            # Bit x of row y is LCD pixel (x, y), surfarray wants tiles indexed [x, y].
+            bits = np.unpackbits(rows[changed].astype("<u4").view(np.uint8), axis=1, bitorder="little")
+            bitmaps = bits.reshape(len(changed), 32, 32).transpose(0, 2, 1)
+            tiles = self.palette[bitmaps].repeat(self.scale, axis=1).repeat(self.scale, axis=2)
+            pixels = pygame.surfarray.pixels3d(screen)
+            for tile, image in zip(changed.tolist(), tiles):
+                rect = self.tile_rect(tile)
+                pixels[rect.left:rect.right, rect.top:rect.bottom] = image
+                dirty.append(rect)
+            del pixels
+        if self.marked != self.selected:
+            for index, color in ((self.marked, BG_COLOR), (self.selected, PIXEL_COLOR)):
+                rect = self.frame_rect(index)
+                if rect is not None:
+                    pygame.draw.rect(screen, color, rect, GAP // 2)
+                    dirty.append(rect)
+            self.marked = self.selected
+        return [screen.get_rect()] if full else dirty
+
+
+def main() -> None:
+    # Click a tile to select its pet, the arrow keys press its buttons, page up/down flip through pets.
+    pygame.init()
+    host = PetHost(PETS)
+    wall = PetWall(host)
+    screen = pygame.display.set_mode(wall.size(), 0, 32)
+    pygame.display.set_caption(f"Tamagotchi wall, {PETS} pets")
+    clock = game_clock.GameClock()
+    clock_ms = pygame.time.get_ticks()
+
+    while True:
+        # Sleeps until the next game step, animation steps only matter while some pet is cleaning.
+        timeout = clock.until_next(bool(host.cleaning.any())) - (pygame.time.get_ticks() - clock_ms)
+        events = [pygame.event.wait(max(1, int(timeout)))] + pygame.event.get()
+        for event in events:
+            if event.type == QUIT:
+                pygame.quit()
+                sys.exit()
+            elif event.type == MOUSEBUTTONDOWN:
+                selected = wall.tile_at(event.pos)
+                if selected is not None:
+                    wall.selected = selected
+            elif event.type == KEYDOWN:
+                if event.key in (K_LEFT, K_DOWN, K_RIGHT):
+                    host.press(wall.selected, BUTTONS[event.key])
+                elif event.key == K_PAGEUP:
+                    wall.scroll(-1)
+                elif event.key == K_PAGEDOWN:
+                    wall.scroll(1)
+
+        now = pygame.time.get_ticks()
+        for step in clock.advance(now - clock_ms):
+            if step == game_clock.ANIMATION:
+                host.animate()
+            else:
+                host.tick()
+        clock_ms = now
+
+        dirty = wall.render(screen)
+        if dirty:
+            pygame.display.update(dirty)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import numpy as np
+
+import simulation as sim
+import sprite_handler as sh
+
+from typing import Dict, Optional
+
+
+# Causes of death, stored per pet in Population.cause.
+ALIVE = 0
+DIED_HUNGER = 1
+DIED_AGE = 2
+CAUSES = {ALIVE: "alive", DIED_HUNGER: "hunger", DIED_AGE: "age"}
+
+STATS = ("age", "hunger", "energy", "waste", "happiness")
+
+# One uniform draw per pet and tick covers do_cycle's choice (6), its 5 in 32 bonus roll and the bonus
+# sign (2), plus get_offset's step (6 values, so it splits evenly over the 2 and 3 step cases).
+DRAWS = 6 * 32 * 2 * 6
+
+# Game ticks the cleaning scroll's 33 animation steps span, do_cycle does not run during them.
+CLEAN_TICKS = 33 * sim.ANIMATION_MS // sim.TICK_MS
+
+
+def cycle_tables():
+    # Per-draw deltas of hunger, energy, waste and happiness for a hatched pet, with an extra zero row
+    # for pets that skip do_cycle, and per-draw offset steps for off < -3, -3 <= off <= 3 and off > 3.
+    draw = np.arange(DRAWS)
+    choice = draw % 6
+    bonus = (draw // 6) % 32 < 5
+    penalty = (draw // 192) % 2 == 0
+    step = draw // 384
+    # Choices 0 to 5 are hunger, energy, energy, waste, happiness, happiness.
+    is_hunger = choice == 0
+    is_energy = (choice == 1) | (choice == 2)
+    is_waste = choice == 3
+    is_happiness = choice >= 4
+    # The four int8 deltas of a draw are packed into one int32, so a single gather fetches all of them.
+    deltas = np.zeros((2 * DRAWS, 4), dtype=np.int8)
+    deltas[:DRAWS, 0] = ~is_hunger + 2 * (is_hunger & bonus)
+    deltas[:DRAWS, 1] = -1 * ~is_energy - 2 * (is_energy & bonus & penalty)
+    deltas[:DRAWS, 2] = ~is_waste + 2 * (is_waste & bonus)
+    deltas[:DRAWS, 3] = -2 * (is_happiness & bonus & penalty)
+    deltas = deltas.view(np.int32).ravel()
+    offset_steps = np.concatenate([step % 2, step % 3 - 1, -(step % 2)]).astype(np.int8)
+    return deltas, offset_steps
+
+
+CYCLE_DELTAS, OFFSET_STEPS = cycle_tables()
+
+
+class Population:
+    # Many unattended pets advanced together, every field is one array entry per pet.
+    # A tick follows PetSimulation.tick: hatching, growing up, waking up, the cleaning scroll, do_cycle,
+    # passing out, the stink/exclaim checks and death. Random draws are made per pet with NumPy, with the
+    # same distribution as do_cycle and get_offset.
+    # The optional care probabilities stand in for a player: each tick, an idle pet that needs food, a
+    # clean or sleep gets it with that probability, as if the button had been pressed before the tick.
+
+    def __init__(
+        self,
+        n: int,
+        seed: Optional[int] = None,
+        feed_prob: float = 0.0,
+        clean_prob: float = 0.0,
+        sleep_prob: float = 0.0,
+    ) -> None:
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.feed_prob = feed_prob
+        self.clean_prob = clean_prob
+        self.sleep_prob = sleep_prob
+        self.ticks = 0
+
+        # Tamagotchi
+        self.age = np.zeros(n, dtype=np.int32)
+        self.hunger = np.zeros(n, dtype=np.int32)
+        self.energy = np.full(n, 8, dtype=np.int32)
+        self.waste = np.zeros(n, dtype=np.int32)
+        self.happiness = np.zeros(n, dtype=np.int32)
+
+        # Counters
+        self.off = np.zeros(n, dtype=np.int8)
+        self.stage = np.zeros(n, dtype=np.int8)
+        # Ticks left until the eating animation and the cleaning scroll finish, 0 when not running.
+        self.eating = np.zeros(n, dtype=np.int8)
+        self.cleaning = np.zeros(n, dtype=np.int8)
+
+        # Flags
+        self.sleeping = np.zeros(n, dtype=bool)
+        self.dead = np.zeros(n, dtype=bool)
+
+        # Outcomes
+        self.cause = np.zeros(n, dtype=np.int8)
+        self.death_tick = np.full(n, -1, dtype=np.int32)
+        self.hatch_tick = np.full(n, -1, dtype=np.int32)
+        # Whether the pet has had a tick without any need since it hatched, and the ticks from hatching to
+        # the first exclaim after that. A new egg starts below ENERGY_TIRED, so its first exclaim says nothing.
+        self.content = np.zeros(n, dtype=bool)
+        self.first_exclaim = np.full(n, -1, dtype=np.int32)
+        self.passouts = np.zeros(n, dtype=np.int32)
+
+    def care(self) -> None:
+        idle = (self.stage > 0) & ~(self.dead | self.sleeping) & (self.cleaning == 0) & (self.eating == 0)
+        roll = self.rng.random((3, self.n))
+        feed = idle & (self.hunger >= sim.HUNGER_NEEDSTOEAT) & (roll[0] < self.feed_prob)
+        # The overlay starts at frame 0 and the meal is finished once it reaches the last frame.
+        self.eating[feed] = sh.SPRITES["OVERLAY_EAT"][1]
+        clean = idle & ~feed & (self.waste >= sim.WASTE_EXPUNGE) & (roll[1] < self.clean_prob)
+        self.cleaning += clean * np.int8(CLEAN_TICKS)
+        sleep = idle & ~feed & ~clean & (self.energy <= sim.ENERGY_TIRED) & (roll[2] < self.sleep_prob)
+        self.sleeping |= sleep
+
+    def tick(self) -> None:
+        # Masked updates are written as arithmetic with boolean arrays, which NumPy runs without branching.
+        if self.feed_prob or self.clean_prob or self.sleep_prob:
+            self.care()
+        self.ticks += 1
+
+        hatch = (self.stage == 0) & (self.age > sim.AGE_HATCH)
+        self.stage += hatch
+        self.hatch_tick += hatch * np.int32(self.ticks + 1)
+        self.stage += (self.stage == 1) & (self.age > sim.AGE_CHILD)
+
+        self.hunger *= self.eating != 1
+
+        woke = self.energy >= 256 - 8
+        self.energy += self.sleeping * np.int32(8)
+        self.sleeping &= ~woke
+
+        # The scroll finishes between this tick and the next, which sees the pet back at offset 0.
+        cleaning = self.cleaning > 0
+        self.cleaning -= cleaning
+        cleaned = cleaning & (self.cleaning == 0)
+        self.off *= ~cleaned
+        self.waste *= ~cleaned
+        cycle = ~(cleaning | self.dead)
+
+        draw = self.rng.integers(0, DRAWS, self.n, dtype=np.uint16)
+        region = (self.off >= -3).view(np.int8) + (self.off > 3)
+        self.off += OFFSET_STEPS.take(draw + region * np.int32(DRAWS)) * cycle
+        self.age += cycle
+        self.age += cycle
+        grown = cycle & (self.stage != 0)
+        # Pets that skip do_cycle index the extra all-zero row of CYCLE_DELTAS.
+        index = draw + ~grown * np.int32(DRAWS)
+        deltas = CYCLE_DELTAS.take(index).view(np.int8).reshape(self.n, 4)
+        self.hunger += deltas[:, 0]
+        self.energy += deltas[:, 1]
+        self.waste += deltas[:, 2]
+        self.happiness += deltas[:, 3]
+        self.happiness -= grown & (self.waste >= sim.WASTE_EXPUNGE)
+
+        passout = grown & (self.energy < sim.ENERGY_PASSOUT)
+        self.happiness -= passout * np.int32(64)
+        self.sleeping |= passout
+        self.passouts += passout
+        # The game never finishes a meal interrupted by passing out, here the meal is dropped instead.
+        self.eating *= ~passout
+        self.eating -= self.eating > 0
+
+        idle = ~(self.sleeping | cleaning | self.dead) & (self.eating == 0)
+        exclaim = idle & (self.waste < sim.WASTE_EXPUNGE) & (
+            (self.energy <= sim.ENERGY_TIRED)
+            | (self.hunger >= sim.HUNGER_NEEDSTOEAT)
+            | (self.waste >= sim.WASTE_EXPUNGE - sim.WASTE_EXPUNGE / 3)
+        )
+        hatched = self.stage > 0
+        onset = exclaim & hatched & self.content & (self.first_exclaim < 0)
+        self.first_exclaim = np.where(onset, self.ticks - self.hatch_tick, self.first_exclaim)
+        self.content |= idle & hatched & ~exclaim & (self.waste < sim.WASTE_EXPUNGE)
+        starved = idle & (self.hunger >= sim.HUNGER_DEADFROMNOTEATING)
+        old = idle & ~starved & (self.age >= sim.AGE_DEATHFROMNATURALCAUSES)
+        died = starved | old
+        self.cause += starved * np.int8(DIED_HUNGER) + old * np.int8(DIED_AGE)
+        self.death_tick += died * np.int32(self.ticks + 1)
+        self.off = np.where(died, np.int8(3), self.off)
+        self.dead |= died
+
+    def step(self, n_ticks: int = 1) -> None:
+        for _ in range(n_ticks):
+            self.tick()
+
+    def run(self, max_ticks: int) -> int:
+        # Steps until every pet is dead or max_ticks have passed, returns the number of ticks run.
+        start = self.ticks
+        while self.ticks - start < max_ticks and not self.dead.all():
+            self.tick()
+        return self.ticks - start
+
+    def summary(self) -> Dict[str, object]:
+        dead = self.dead
+        lifespan = self.death_tick[dead]
+        exclaimed = self.first_exclaim[self.first_exclaim >= 0]
+        report: Dict[str, object] = {
+            "pets": self.n,
+            "ticks": self.ticks,
+            "alive": int(self.n - dead.sum()),
+            "causes": {name: int((self.cause == cause).sum()) for cause, name in CAUSES.items()},
+            "lifespan_mean": float(lifespan.mean()) if lifespan.size else float("nan"),
+            "lifespan_percentiles": percentiles(lifespan),
+            "first_exclaim_mean": float(exclaimed.mean()) if exclaimed.size else float("nan"),
+            "passouts_mean": float(self.passouts.mean()),
+        }
+        for stat in STATS:
+            report[stat] = percentiles(getattr(self, stat))
+        return report
+
+
+def percentiles(values: np.ndarray) -> Dict[str, float]:
+    if not values.size:
+        return {}
+    p5, p50, p95 = np.percentile(values, [5, 50, 95])
+    return {
+        "min": float(values.min()),
+        "p5": float(p5),
+        "p50": float(p50),
+        "p95": float(p95),
+        "max": float(values.max()),
+    }
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+
+import sprite_handler as sh
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from replay import Recording, replay_steps
+from simulation import ANIMATION_MS, TICK_MS
+from tamagotchi import BG_COLOR, NONPIXEL_COLOR, PIXEL_COLOR, compose_display
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+
+# An LCD frame as its 32 packed rows and how many milliseconds it stays on screen.
+Frame = Tuple[np.ndarray, int]
+
+FORMATS = ("gif", "apng", "raw")
+EXTENSIONS = {"gif": ".gif", "apng": ".png", "raw": ".rgb"}
+# Palette indices of the images: the gaps between cells, unlit and lit LCD pixels.
+PALETTE = (BG_COLOR, NONPIXEL_COLOR, PIXEL_COLOR)
+# Each LCD pixel is a CELL x CELL square on a PITCH pitch, the game draws 8 on 10 at 320x320.
+CELL = 8
+PITCH = 10
+# Raw frames are repeated to this constant rate for video encoders, e.g.
+#   ffmpeg -f rawvideo -pix_fmt rgb24 -s 320x320 -r 10 -i IDLE_BABY.rgb IDLE_BABY.mp4
+RAW_FPS = 1000 // ANIMATION_MS
+PREVIEW_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "previews")
+
+
+def lcd_rows(sprite: sh.Sprite, off=0, percv=0) -> np.ndarray:
+    return sh.PackedSprite.from_bitmap(compose_display(sprite, off, percv)).rows
+
+
+def animation_frames(name: str, overlay: Optional[str] = None, off: int = 0) -> List[Frame]:
+    # One loop of an animation, with an overlay running along as in game. Both advance once per tick,
+    # so the loop lasts until they line up again.
+    sprites = sh.get(name)
+    overlays = sh.get(overlay) if overlay else [sh.PackedSprite(np.zeros(32, dtype=np.uint32))]
+    length = len(sprites) * len(overlays) // math.gcd(len(sprites), len(overlays))
+    return [(lcd_rows(sprites[i % len(sprites)] | overlays[i % len(overlays)], off), TICK_MS) for i in range(length)]
+
+
+def cleaning_frames(name: str) -> List[Frame]:
+    # The flush: the clean overlay scrolls the pet off the LCD one column per animation step.
+    sprite = sh.get(name)[0] | sh.get("OVERLAY_CLEAN")[0]
+    return [(lcd_rows(sprite, off), ANIMATION_MS) for off in range(0, -33, -1)]
+
+
+def session_frames(recording: Recording, max_ms: Optional[float] = None) -> List[Frame]:
+    # What the LCD showed during a recorded session, one frame per change of picture.
+    frames: List[Frame] = []
+    key, shown_at, end = None, 0.0, 0.0
+    for now, sim in replay_steps(recording):
+        if max_ms is not None and now > max_ms:
+            end = max_ms
+            break
+        end = now
+        display_key = sim.display_key()
+        if display_key == key:
+            continue
+        if frames:
+            frames[-1] = (frames[-1][0], round(now - shown_at))
+        key, shown_at = display_key, now
+        frames.append((lcd_rows(*sim.display()), 0))
+    if frames:
+        frames[-1] = (frames[-1][0], max(ANIMATION_MS, round(end - shown_at)))
+    # Changes on the same step, e.g. a key press and the tick right after it, only show the last one.
+    return [frame for frame in frames if frame[1] > 0]
+
+
+def lcd_images(frames: List[Frame], cell: int = CELL, pitch: int = PITCH) -> np.ndarray:
+    # Palette index images of the frames, shape (frames, 32 * pitch, 32 * pitch).
+    rows = np.stack([frame[0] for frame in frames]).astype("<u4")
+    lit = np.unpackbits(rows.view(np.uint8).reshape(len(frames), 32, 4), axis=2, bitorder="little")
+    images = np.zeros((len(frames), 32, pitch, 32, pitch), dtype=np.uint8)
+    images[:, :, :cell, :, :cell] = (lit + 1)[:, :, None, :, None]
+    return images.reshape(len(frames), 32 * pitch, 32 * pitch)
+
+
+def encode(frames: List[Frame], out: BinaryIO, fmt: str = "gif", cell: int = CELL, pitch: int = PITCH) -> None:
+    durations = [duration for _, duration in frames]
+    if fmt == "raw":
+        # rgb24 at RAW_FPS, every frame written again for as long as it is shown. Frames are converted one
+        # at a time, a session repeated to a constant rate is too large to hold in memory.
+        palette = np.array(PALETTE, dtype=np.uint8)
+        for frame, duration in zip(frames, durations):
+            data = palette[lcd_images([frame], cell, pitch)[0]].tobytes()
+            for _ in range(max(1, round(duration * RAW_FPS / 1000))):
+                out.write(data)
+        return
+    images = lcd_images(frames, cell, pitch)
+    from PIL import Image
+
+    palette = [channel for color in PALETTE for channel in color]
+    pictures = []
+    for image in images:
+        picture = Image.fromarray(image, mode="P")
+        picture.putpalette(palette)
+        pictures.append(picture)
+    pictures[0].save(
+        out,
+        format="GIF" if fmt == "gif" else "PNG",
+        save_all=True,
+        append_images=pictures[1:],
+        duration=durations,
+        loop=0,
+        # Frames are still cropped to the changed area, Pillow's optimize only adds a transparency pass
+        # over every pixel that costs more than the encoding and saves little on two-colour frames.
+        optimize=False,
+    )
+
+
+def catalogue() -> List[Tuple[str, str, tuple]]:
+    # Every preview of the storefront: each animation alone and with each overlay, each overlay on
+    # its own and the flush of each idle animation. Entries are (name, kind, arguments).
+    animations = [name for name, (_, _, category) in sh.SPRITES.items() if category not in ("overlay", "component")]
+    overlays = [name for name, (_, _, category) in sh.SPRITES.items() if category == "overlay"]
+    jobs = []
+    for name in animations:
+        jobs.append((name, "animation", (name,)))
+        for overlay in overlays:
+            jobs.append((f"{name}+{overlay}", "animation", (name, overlay)))
+        if name.startswith("IDLE"):
+            jobs.append((f"{name}+FLUSH", "cleaning", (name,)))
+    for overlay in overlays:
+        jobs.append((overlay, "animation", (overlay,)))
+    return jobs
+
+
+def render_job(kind: str, args: tuple, fmt: str, filename: str) -> int:
+    # Runs in a worker process, sprites are loaded from the atlas on first use there. The preview is
+    # written by the worker, only its size goes back.
+    if kind == "animation":
+        frames = animation_frames(*args)
+    elif kind == "cleaning":
+        frames = cleaning_frames(*args)
+    elif kind == "session":
+        frames = session_frames(Recording.load(args[0]), *args[1:])
+    else:
+        raise ValueError(f"unknown preview kind {kind}")
+    with open(filename, "wb") as f:
+        encode(frames, f, fmt)
+        return f.tell()
+
+
+def render_all(
+    jobs: Iterable[Tuple[str, str, tuple]],
+    out_folder: str = PREVIEW_FOLDER,
+    fmt: str = "gif",
+    workers: Optional[int] = None,
+) -> Dict[str, int]:
+    # Renders the jobs across a process pool and writes NAME + extension into out_folder. Returns the
+    # size of every file written.
+    os.makedirs(out_folder, exist_ok=True)
+    sizes = {}
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {}
+        for name, kind, args in jobs:
+            filename = os.path.join(out_folder, name + EXTENSIONS[fmt])
+            futures[pool.submit(render_job, kind, args, fmt, filename)] = filename
+        for future in as_completed(futures):
+            sizes[futures[future]] = future.result()
+    return sizes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Render animation previews and recorded sessions without a display.")
+    parser.add_argument("names", nargs="*", help="catalogue entries to render, all of them by default")
+    parser.add_argument(
+        "--recording", action="append", default=[], help="render a recorded session, then only named catalogue entries"
+    )
+    parser.add_argument("--max-seconds", type=float, help="cut recorded sessions after this much game time")
+    parser.add_argument("--format", choices=FORMATS, default="gif")
+    parser.add_argument("--out", default=PREVIEW_FOLDER)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--list", action="store_true", help="print the catalogue entries and exit")
+    args = parser.parse_args()
+
+    jobs = catalogue()
+    if args.list:
+        for name, _, _ in jobs:
+            print(name)
+        return
+    if args.names:
+        unknown = set(args.names) - {name for name, _, _ in jobs}
+        if unknown:
+            parser.error(f"not in the catalogue: {', '.join(sorted(unknown))}")
+        jobs = [job for job in jobs if job[0] in args.names]
+    elif args.recording:
+        jobs = []
+    max_ms = args.max_seconds * 1000 if args.max_seconds else None
+    for filename in args.recording:
+        jobs.append((os.path.splitext(os.path.basename(filename))[0], "session", (filename, max_ms)))
+
+    start = time.perf_counter()
+    sizes = render_all(jobs, args.out, args.format, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{len(sizes)} previews, {sum(sizes.values()) / 1024:.0f} KiB in {elapsed:.2f} s to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
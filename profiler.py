@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import json
+import numpy as np
+import os
+import time
+
+from typing import Dict, List, Tuple
+
+# Phases of one pass through the game loop, in the order they run.
+EVENTS = 0
+LOGIC = 1
+COMPONENTS = 2
+DISPLAY = 3
+HUD = 4
+UPDATE = 5
+IDLE = 6
+PHASES = ("events", "logic", "components", "display", "hud", "update", "idle")
+PHASE_COLORS = (
+    (80, 110, 200),
+    (200, 80, 80),
+    (220, 160, 40),
+    (60, 150, 60),
+    (150, 80, 180),
+    (40, 170, 170),
+    (200, 200, 200),
+)
+
+TRACE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trace.json")
+
+
+class FrameProfiler:
+    # Records how long each phase of the game loop takes into a ring buffer of the last capacity spans.
+    # begin(phase) ends the span that is open and opens the next one, so the loop needs one call per
+    # phase. The game only creates a profiler when profiling is on and checks for None everywhere
+    # else, so a disabled profiler costs nothing.
+
+    def __init__(self, capacity: int = 4096) -> None:
+        self.capacity = capacity
+        self.phases = np.zeros(capacity, dtype=np.int8)
+        self.starts = np.zeros(capacity, dtype=np.int64)
+        self.ends = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+        self.phase = -1
+        self.start = 0
+        self.origin = time.perf_counter_ns()
+
+    def begin(self, phase: int) -> None:
+        now = time.perf_counter_ns()
+        if self.phase >= 0:
+            slot = self.count % self.capacity
+            self.phases[slot] = self.phase
+            self.starts[slot] = self.start
+            self.ends[slot] = now
+            self.count += 1
+        self.phase = phase
+        self.start = now
+
+    def spans(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Phases, start and end times in nanoseconds of the recorded spans, oldest first.
+        n = min(self.count, self.capacity)
+        order = (np.arange(n) + self.count - n) % self.capacity
+        return self.phases[order], self.starts[order], self.ends[order]
+
+    def frame_times(self, frames: int) -> np.ndarray:
+        # Milliseconds per phase of the last frames complete frames, shape (frames, len(PHASES)).
+        phases, starts, ends = self.spans()
+        frame = np.cumsum(phases == EVENTS) - 1
+        complete = frame < frame[-1] if frame.size else frame.astype(bool)
+        last = frame[-1] if frame.size else 0
+        times = np.zeros((frames, len(PHASES)))
+        rows = frame[complete] - last + frames
+        keep = rows >= 0
+        np.add.at(times, (rows[keep], phases[complete][keep]), (ends - starts)[complete][keep] / 1e6)
+        return times
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        phases, starts, ends = self.spans()
+        durations = (ends - starts) / 1e6
+        report = {}
+        for phase, name in enumerate(PHASES):
+            times = durations[phases == phase]
+            if times.size:
+                p50, p95, p99 = np.percentile(times, [50, 95, 99])
+                report[name] = {
+                    "p50_ms": float(p50),
+                    "p95_ms": float(p95),
+                    "p99_ms": float(p99),
+                    "max_ms": float(times.max()),
+                }
+        return report
+
+    def trace_events(self) -> List[Dict[str, object]]:
+        # Complete events of the Chrome trace event format, timestamps in microseconds.
+        phases, starts, ends = self.spans()
+        return [
+            {
+                "name": PHASES[phase],
+                "ph": "X",
+                "ts": (start - self.origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": 0,
+                "tid": 0,
+            }
+            for phase, start, end in zip(phases.tolist(), starts.tolist(), ends.tolist())
+        ]
+
+    def dump(self, filename: str = TRACE_FILE) -> None:
+        # Open with chrome://tracing or Perfetto.
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+
+    def graph(self, width: int, height: int, ms_per_pixel: float = 0.5) -> np.ndarray:
+        # Stacked per-phase bars of the last width frames as an RGB array for surfarray, newest on the right.
+        times = self.frame_times(width) / ms_per_pixel
+        tops = np.minimum(np.cumsum(times, axis=1), height)
+        bottoms = np.concatenate([np.zeros((width, 1)), tops[:, :-1]], axis=1)
+        y = np.arange(height)[None, :, None]
+        # Rows count up from the bottom of the graph, a pixel takes the color of the phase it falls into.
+        inside = (height - 1 - y >= bottoms[:, None, :]) & (height - 1 - y < tops[:, None, :])
+        image = inside[..., None] * np.array(PHASE_COLORS, dtype=np.uint8)[None, None]
+        return image.max(axis=2).astype(np.uint8)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import struct
+import sys
+import time
+
+from game_clock import ANIMATION, GameClock
+from persistence import BUTTON_CODES, BUTTON_NAMES, pack_state, unpack_state
+from simulation import PetSimulation
+from typing import Iterator, List, Tuple
+
+RECORDING_MAGIC = b"TMGR"
+RECORDING_VERSION = 2
+# magic, version, seed, number of key presses, length of the start state
+HEADER = struct.Struct("<4sBQIH")
+# game tick and animation step the key was pressed after, button
+EVENT = struct.Struct("<QIB")
+# game ticks and animation steps at the end, state hash
+FOOTER = struct.Struct("<QI20s")
+
+
+def state_hash(sim: PetSimulation) -> bytes:
+    return hashlib.sha1(pack_state(sim)).digest()
+
+
+class Recording:
+    # A play session: the seed and state it started from, every key press with the game tick and
+    # animation step it happened after, and where the session ended with its state hash.
+
+    def __init__(self, seed: int, start: bytes) -> None:
+        self.seed = seed
+        self.start = start
+        self.events: List[Tuple[int, int, str]] = []
+        self.ticks = 0
+        self.steps = 0
+        self.final_hash = b""
+
+    @classmethod
+    def begin(cls, sim: PetSimulation, seed: int) -> Recording:
+        # Reseeds sim, so the recording starts from a known generator state. Must be called before the
+        # game clock starts, replays run the steps in game_clock order from there.
+        sim.rng.seed(seed)
+        sim.steps = 0
+        return cls(seed, pack_state(sim))
+
+    def press(self, sim: PetSimulation, button: str) -> None:
+        self.events.append((sim.ticks, sim.steps, button))
+
+    def finish(self, sim: PetSimulation) -> None:
+        self.ticks = sim.ticks
+        self.steps = sim.steps
+        self.final_hash = state_hash(sim)
+
+    def to_bytes(self) -> bytes:
+        return b"".join(
+            [
+                HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, self.seed, len(self.events), len(self.start)),
+                self.start,
+                *(EVENT.pack(tick, step, BUTTON_CODES[button]) for tick, step, button in self.events),
+                FOOTER.pack(self.ticks, self.steps, self.final_hash),
+            ]
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Recording:
+        magic, version, seed, n_events, start_length = HEADER.unpack_from(data)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError("not a recording")
+        pos = HEADER.size
+        recording = cls(seed, data[pos:pos + start_length])
+        pos += start_length
+        for tick, step, code in EVENT.iter_unpack(data[pos:pos + n_events * EVENT.size]):
+            recording.events.append((tick, step, BUTTON_NAMES[code]))
+        recording.ticks, recording.steps, recording.final_hash = FOOTER.unpack_from(data, pos + n_events * EVENT.size)
+        return recording
+
+    def save(self, filename: str) -> None:
+        with open(filename, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, filename: str) -> Recording:
+        with open(filename, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def replay_steps(recording: Recording) -> Iterator[Tuple[float, PetSimulation]]:
+    # Runs the session again without a display, yielding the game time in milliseconds and the
+    # simulation after every game step and key press. The same simulation is yielded every time.
+    sim = PetSimulation(recording.seed)
+    unpack_state(recording.start, sim)
+    clock = GameClock()
+    yield clock.now, sim
+
+    def run_until(tick: int, step: int) -> Iterator[Tuple[float, PetSimulation]]:
+        while (sim.ticks, sim.steps) < (tick, step):
+            if clock.next_step() == ANIMATION:
+                sim.animate()
+            else:
+                sim.tick()
+            yield clock.now, sim
+
+    for tick, step, button in recording.events:
+        yield from run_until(tick, step)
+        sim.press(button)
+        yield clock.now, sim
+    yield from run_until(recording.ticks, recording.steps)
+
+
+def replay(recording: Recording) -> PetSimulation:
+    # Runs the session again as fast as the simulation goes and returns it in its final state.
+    for _, sim in replay_steps(recording):
+        pass
+    return sim
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded sessions and check they end in the same state.")
+    parser.add_argument("recordings", nargs="+")
+    args = parser.parse_args()
+
+    failed = False
+    for filename in args.recordings:
+        recording = Recording.load(filename)
+        start = time.perf_counter()
+        sim = replay(recording)
+        elapsed = time.perf_counter() - start
+        ok = state_hash(sim) == recording.final_hash
+        failed |= not ok
+        print(
+            f"{filename}: {'OK' if ok else 'MISMATCH'} {len(recording.events)} presses, "
+            f"{recording.ticks} ticks in {elapsed * 1000:.1f} ms"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+from __future__ import annotations
+
+import numpy as np
+import random
+
+import sprite_handler as sh
+
+from typing import Optional, Tuple
+
+
+# Used "y = round((98.3415 * x + 128) / 8) * 8" to plot ages, subject to change for balancing.
+AGE_HATCH = 128
+AGE_CHILD = 816  # Original: 796. Appx. 7 yo
+AGE_TEEN = 1408  # Appx. 13 yo
+AGE_ADULT = 2584  # Appx 25 yo
+AGE_SPECIAL = 5048  # Appx 50 yo
+AGE_DEATHFROMNATURALCAUSES = 8192  # Appx. 82 yo, original number
+
+HUNGER_CANEAT = 32
+HUNGER_NEEDSTOEAT = 128
+HUNGER_SICKFROMNOTEATING = 256
+HUNGER_DEADFROMNOTEATING = 512
+ENERGY_CANSLEEP = 150
+ENERGY_TIRED = 64
+ENERGY_PASSOUT = 8
+WASTE_EXPUNGE = 256
+
+SECOND = 1000
+# Game logic runs once per TICK_MS, animations such as the cleaning scroll once per ANIMATION_MS.
+TICK_MS = SECOND
+ANIMATION_MS = SECOND // 10
+
+# Buttons, in the order they sit under the LCD's left, down and right keys.
+LEFT = "left"
+DOWN = "down"
+RIGHT = "right"
+
+# Sprite categories of each stage, used to pick what to prefetch next.
+STAGES = ("egg", "baby", "child")
+
+# Outcomes of one do_cycle call on a hatched pet: hunger, hunger with bonus, energy, energy with
+# penalty, waste, waste with bonus, happiness and happiness with penalty, see skip().
+CYCLE_OUTCOMES = (
+    1 / 6 * 27 / 32,
+    1 / 6 * 5 / 32,
+    2 / 6 * 59 / 64,
+    2 / 6 * 5 / 64,
+    1 / 6 * 27 / 32,
+    1 / 6 * 5 / 32,
+    2 / 6 * 59 / 64,
+    2 / 6 * 5 / 64,
+)
+# Values the frame counter of an animation runs through where that differs from its number of frames.
+# The original game counted the clean overlay's frames by the 32 rows of its single sprite, which sets
+# where the next overlay starts and when a meal the cleaning cut into is over.
+FRAME_CYCLES = {"OVERLAY_CLEAN": 32}
+# fast_forward runs ticks one by one when fewer than this many can be skipped in bulk.
+MIN_CHUNK = 4
+
+
+def do_cycle(pet: dict, stage: int, rng: random.Random = random) -> None:
+    pet["age"] += 2
+    if stage != 0:
+        choice = rng.choice(["hunger", "energy", "energy", "waste", "happiness", "happiness"])
+        if rng.randint(0, 31) < 5:
+            if choice in ("energy", "happiness"):
+                pet[choice] += rng.choice([-2, 0])
+            else:
+                pet[choice] += 2
+
+        if choice != "hunger":
+            pet["hunger"] += 1
+        if choice != "waste":
+            pet["waste"] += 1
+        if choice != "energy":
+            pet["energy"] -= 1
+
+        if pet["waste"] >= WASTE_EXPUNGE:
+            pet["happiness"] -= 1
+
+
+def get_offset(off: int, rng: random.Random = random) -> int:
+    if -3 <= off <= 3:
+        return rng.choice([-1, 0, 1]) + off
+    elif off < -3:
+        return rng.choice([0, 1]) + off
+    else:
+        return rng.choice([-1, 0]) + off
+
+
+def offset_transitions(max_steps: int = 32) -> np.ndarray:
+    # Cumulative distributions of get_offset applied 1 to max_steps times, indexed [steps, off + 4].
+    # The walk stays within -4..4 and has forgotten where it started long before max_steps.
+    step = np.zeros((9, 9))
+    for off in range(-4, 5):
+        moves = (-1, 0, 1) if -3 <= off <= 3 else (0, 1) if off < -3 else (-1, 0)
+        for move in moves:
+            step[off + 4, off + move + 4] += 1 / len(moves)
+    powers = [np.eye(9)]
+    for _ in range(max_steps):
+        powers.append(powers[-1] @ step)
+    return np.cumsum(powers, axis=2)
+
+
+def frame_cycle(animation: str) -> int:
+    return FRAME_CYCLES.get(animation, sh.SPRITES[animation][1])
+
+
+def get_next_frame(animation: str, current_frame: int) -> int:
+    return (current_frame + 1) % frame_cycle(animation)
+
+
+def trigger_death(stage: int) -> Tuple[str, str, bool, bool]:
+    if stage == 1:
+        current_anim = "SLEEP_BABY"
+    elif stage == 2:
+        current_anim = "SLEEP_CHILD"
+    overlay_anim = "OVERLAY_DEAD"
+    return current_anim, overlay_anim, True, True
+
+
+def trigger_sleep(stage: int) -> Tuple[str, str, bool, bool]:
+    if stage == 1:
+        current_anim = "SLEEP_BABY"
+    elif stage == 2:
+        current_anim = "SLEEP_CHILD"
+    overlay_anim = "OVERLAY_ZZZ"
+    return current_anim, overlay_anim, True, True
+
+
+def update_page(spid: int) -> str:
+    if spid == 0:
+        stats_page = "DISPLAY_HUNGER"
+    elif spid == 1:
+        stats_page = "DISPLAY_AGE"
+    elif spid == 2:
+        stats_page = "DISPLAY_WASTE"
+    elif spid == 3:
+        stats_page = "DISPLAY_ENERGY"
+    elif spid == 4:
+        stats_page = "DISPLAY_BACK"
+    return stats_page
+
+
+OFFSET_TRANSITIONS = offset_transitions()
+
+
+class PetSimulation:
+    # The whole game state, advanced by tick() once per TICK_MS, by animate() once per ANIMATION_MS and
+    # by press() on key presses.
+    # Animations are referred to by their sprite_handler name, nothing here needs a display.
+    # All randomness comes from rng, so the same seed and key presses always give the same game.
+
+    def __init__(self, seed: Optional[int] = None) -> None:
+        self.rng = random.Random(seed)
+
+        # Tamagotchi
+        self.pet: dict[str, int] = {
+            "hunger": 0,
+            "energy": 8,
+            "waste": 0,
+            "age": 0,
+            "happiness": 0,
+        }
+
+        # Counters
+        # off is the horizontal offset
+        self.off: int = 0
+        # selid is the selected button
+        self.selid: int = 0  # TODO: Remove when buttons have been removed.
+        # spid is the selected page
+        self.spid: int = 0  # TODO: This will probably need to be modified.
+        self.stage: int = 0
+        self.frame: int = 0
+        self.ol_frame: int = 0
+        self.ticks: int = 0
+        # Animation steps this session, only used to line up replays.
+        self.steps: int = 0
+
+        # Flags
+        self.stats: bool = False
+        self.has_overlay: bool = False
+        self.cleaning: bool = False
+        self.eating: bool = False
+        self.sleeping: bool = False
+        self.dead: bool = False
+
+        self.current_anim: str = "IDLE_EGG"
+        self.overlay_anim: str = "OVERLAY_ZZZ"
+        self.stats_page: str = "DISPLAY_HUNGER"
+
+    def press(self, button: str) -> None:
+        pet = self.pet
+        if button == LEFT:
+            if self.stats:
+                self.spid -= 1
+                if self.spid <= -1:
+                    self.spid = 4
+                self.stats_page = update_page(self.spid)
+            else:
+                self.selid -= 1
+                if self.selid <= -1:
+                    self.spid = 4
+                self.stats_page = update_page(self.spid)
+        elif button == DOWN:
+            if self.stage > 0 or self.selid == 2:
+                if self.selid == 0:
+                    self.eating = True
+                    self.overlay_anim = "OVERLAY_EAT"
+                    self.ol_frame = 0
+                    self.has_overlay = True
+                elif self.selid == 1:
+                    self.cleaning = True
+                    self.overlay_anim = "OVERLAY_CLEAN"
+                    self.ol_frame = 0
+                    self.has_overlay = True
+                elif self.selid == 2:
+                    self.stats = not self.stats
+                elif self.selid == 3:
+                    if pet["energy"] <= ENERGY_CANSLEEP:
+                        (
+                            self.current_anim,
+                            self.overlay_anim,
+                            self.sleeping,
+                            self.has_overlay,
+                        ) = trigger_sleep(self.stage)
+        elif button == RIGHT:
+            if self.stats:
+                self.spid += 1
+                self.spid %= 5
+                self.stats_page = update_page(self.spid)
+            else:
+                self.selid += 1
+                self.selid %= 4
+
+    def step(self, n_ticks: int = 1) -> None:
+        # n_ticks game ticks with the animation steps in between, in the order game_clock runs them.
+        for _ in range(n_ticks):
+            for _ in range(TICK_MS // ANIMATION_MS):
+                self.animate()
+            self.tick()
+
+    def tick(self) -> None:
+        pet = self.pet
+        self.ticks += 1
+        if self.stage == 0 and pet["age"] > AGE_HATCH:
+            self.stage += 1
+            self.current_anim = "IDLE_BABY"
+            self.has_overlay = False
+        if self.stage == 1 and pet["age"] > AGE_CHILD:
+            self.stage += 1
+            self.current_anim = "IDLE_CHILD"
+        if self.eating and self.ol_frame == frame_cycle(self.overlay_anim) - 1:
+            self.eating = False
+            self.has_overlay = False
+            self.ol_frame = 0
+            pet["hunger"] = 0
+        if self.sleeping:
+            pet["energy"] += 8
+            if pet["energy"] >= 256:
+                self.sleeping = False
+                self.has_overlay = False
+                if self.stage == 0:
+                    self.current_anim = "IDLE_EGG"
+                elif self.stage == 1:
+                    self.current_anim = "IDLE_BABY"
+                elif self.stage == 2:
+                    self.current_anim = "IDLE_CHILD"
+        if not self.cleaning:
+            if not self.dead:
+                self.frame = get_next_frame(self.current_anim, self.frame)
+                self.off = get_offset(self.off, self.rng)
+                do_cycle(pet, self.stage, self.rng)
+                if pet["energy"] < ENERGY_PASSOUT and self.stage > 0:
+                    pet["happiness"] -= 64
+                    self.current_anim, self.overlay_anim, self.sleeping, self.has_overlay = trigger_sleep(self.stage)
+
+        if not any([self.sleeping, self.cleaning, self.eating, self.dead]):
+            if pet["waste"] >= WASTE_EXPUNGE:
+                self.overlay_anim = "OVERLAY_STINK"
+                self.has_overlay = True
+            elif (
+                pet["energy"] <= ENERGY_TIRED
+                or pet["hunger"] >= HUNGER_NEEDSTOEAT
+                or pet["waste"] >= WASTE_EXPUNGE - WASTE_EXPUNGE / 3
+            ):
+                self.overlay_anim = "OVERLAY_EXCLAIM"
+                self.has_overlay = True
+            if not self.dead and (
+                    pet["hunger"] >= HUNGER_DEADFROMNOTEATING
+                    or pet["age"] >= AGE_DEATHFROMNATURALCAUSES
+            ):
+                self.off = 3
+                self.current_anim, self.overlay_anim, self.dead, self.has_overlay = trigger_death(self.stage)
+
+        if self.has_overlay:
+            self.ol_frame = get_next_frame(self.overlay_anim, self.ol_frame)
+
+    def animate(self) -> None:
+        # The cleaning scroll moves the pet off the LCD one column per step, then the waste is gone.
+        self.steps += 1
+        if self.cleaning:
+            self.off -= 1
+            if self.off == -33:
+                self.off = 0
+                self.cleaning = False
+                self.has_overlay = False
+                self.pet["waste"] = 0
+
+    def chunk_limit(self) -> int:
+        # How many ticks can be applied in bulk without any threshold being crossed before the last one.
+        # Hunger and waste grow and energy falls by at most 2 per tick, so halving the distance to each
+        # threshold is always safe. Zero means the next tick has to run on its own.
+        pet = self.pet
+        if self.cleaning or self.eating:
+            return 0
+        if self.dead:
+            return 0 if self.sleeping else 1 << 62
+        limits = []
+        if self.stage == 0:
+            limits.append((AGE_HATCH - pet["age"]) // 2)
+        elif self.stage == 1:
+            limits.append((AGE_CHILD - pet["age"]) // 2)
+        if pet["waste"] < WASTE_EXPUNGE:
+            limits.append((WASTE_EXPUNGE - 1 - pet["waste"]) // 2)
+        if self.sleeping:
+            if pet["energy"] < ENERGY_PASSOUT:
+                return 0
+            limits.append((255 - pet["energy"]) // 8)
+        elif self.stage > 0:
+            limits.append((pet["energy"] - ENERGY_PASSOUT) // 2)
+            limits.append((HUNGER_DEADFROMNOTEATING - 1 - pet["hunger"]) // 2)
+            limits.append((AGE_DEATHFROMNATURALCAUSES - 1 - pet["age"]) // 2)
+            # The overlay checks below only change the picture, but keep the state exact as well.
+            if pet["energy"] > ENERGY_TIRED:
+                limits.append((pet["energy"] - ENERGY_TIRED - 1) // 2)
+            if pet["hunger"] < HUNGER_NEEDSTOEAT:
+                limits.append((HUNGER_NEEDSTOEAT - 1 - pet["hunger"]) // 2)
+            if pet["waste"] < WASTE_EXPUNGE - WASTE_EXPUNGE / 3:
+                limits.append(int((WASTE_EXPUNGE - WASTE_EXPUNGE / 3 - 1 - pet["waste"]) // 2))
+        return max(0, min(limits, default=1 << 62))
+
+    def skip(self, n_ticks: int, rng: np.random.Generator) -> None:
+        # Applies n_ticks ticks at once, n_ticks must not exceed chunk_limit().
+        pet = self.pet
+        self.ticks += n_ticks
+        if self.dead:
+            if self.has_overlay:
+                self.ol_frame = (self.ol_frame + n_ticks) % frame_cycle(self.overlay_anim)
+            return
+        if not self.sleeping and (
+            pet["waste"] >= WASTE_EXPUNGE
+            or pet["energy"] <= ENERGY_TIRED
+            or pet["hunger"] >= HUNGER_NEEDSTOEAT
+            or pet["waste"] >= WASTE_EXPUNGE - WASTE_EXPUNGE / 3
+        ):
+            self.overlay_anim = "OVERLAY_STINK" if pet["waste"] >= WASTE_EXPUNGE else "OVERLAY_EXCLAIM"
+            self.has_overlay = True
+        if self.stage > 0:
+            counts = rng.multinomial(n_ticks, CYCLE_OUTCOMES).tolist()
+            hunger, energy, waste = counts[0] + counts[1], counts[2] + counts[3], counts[4] + counts[5]
+            if pet["waste"] >= WASTE_EXPUNGE:
+                pet["happiness"] -= n_ticks
+            pet["hunger"] += n_ticks - hunger + 2 * counts[1]
+            pet["energy"] -= n_ticks - energy + 2 * counts[3]
+            pet["waste"] += n_ticks - waste + 2 * counts[5]
+            pet["happiness"] -= 2 * counts[7]
+            if self.sleeping:
+                pet["energy"] += 8 * n_ticks
+        pet["age"] += 2 * n_ticks
+        self.frame = (self.frame + n_ticks) % sh.SPRITES[self.current_anim][1]
+        steps = OFFSET_TRANSITIONS[min(n_ticks, len(OFFSET_TRANSITIONS) - 1), self.off + 4]
+        self.off = int(np.searchsorted(steps, rng.random() * steps[-1], side="right")) - 4
+        if self.has_overlay:
+            self.ol_frame = (self.ol_frame + n_ticks) % frame_cycle(self.overlay_anim)
+
+    def fast_forward(self, elapsed_ms: int, rng: Optional[np.random.Generator] = None) -> int:
+        # Catches up on elapsed_ms of game time, e.g. while the game was closed, and returns the
+        # milliseconds left over that are not worth a full tick yet.
+        # Stretches without any threshold in reach are sampled in bulk from do_cycle's distribution,
+        # everything else runs tick by tick, so hatching, growing up, passing out and death land on the
+        # same tick they would have.
+        rng = rng or np.random.default_rng(self.rng.getrandbits(64))
+        while elapsed_ms >= TICK_MS:
+            n_ticks = min(self.chunk_limit(), elapsed_ms // TICK_MS)
+            if n_ticks >= MIN_CHUNK:
+                self.skip(n_ticks, rng)
+                elapsed_ms -= n_ticks * TICK_MS
+            else:
+                elapsed_ms -= TICK_MS
+                self.step()
+        return elapsed_ms
+
+    def progress(self) -> float:
+        # Length of the progress bar on the current stats page, 0 to 27 pixels.
+        pet = self.pet
+        if self.spid == 0:
+            percv = pet["hunger"] * 27 / HUNGER_NEEDSTOEAT
+        elif self.spid == 1:
+            percv = pet["age"] * 27 / AGE_DEATHFROMNATURALCAUSES
+        elif self.spid == 2:
+            percv = (pet["waste"] % WASTE_EXPUNGE) * 27 / WASTE_EXPUNGE
+        elif self.spid == 3:
+            percv = pet["energy"] * 27 / 256
+        elif self.spid == 4:
+            percv = 0
+        if percv > 27:
+            percv = 27
+        return percv
+
+    def display_key(self) -> tuple:
+        # Everything the LCD contents depend on, equal keys always render the same image.
+        if self.stats:
+            return (self.stats_page, self.progress())
+        if self.has_overlay:
+            return (self.current_anim, self.frame, self.overlay_anim, self.overlay_frame(), self.off)
+        return (self.current_anim, self.frame, self.off)
+
+    def overlay_frame(self) -> int:
+        return self.ol_frame % sh.SPRITES[self.overlay_anim][1]
+
+    def display(self) -> Tuple[sh.PackedSprite, int, float]:
+        # The sprite, horizontal offset and progress bar length to show on the LCD.
+        if self.stats:
+            return sh.get(self.stats_page), 0, self.progress()
+        sprite = sh.get(self.current_anim)[self.frame]
+        if self.has_overlay:
+            sprite = sprite | sh.get(self.overlay_anim)[self.overlay_frame()]
+        return sprite, self.off, 0
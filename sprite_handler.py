@@ -1,21 +1,83 @@
 from __future__ import annotations
 
+import hashlib
 import numpy as np
 
 import os
+import struct
+import tempfile
+import threading
+import zipfile
 
-from PIL import Image
-from typing import List
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
+sprite_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sprites")
+# Compiled from the PNG tree, entries whose PNGs changed since are rebuilt on first access.
+ATLAS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sprite_atlas.npz")
+
+
+class PackedSprite:
+    # A 1-bit 32x32 frame stored as one uint32 per row, bit x of a row is pixel x.
+    __slots__ = ("rows",)
+
+    def __init__(self, rows) -> None:
+        self.rows = np.asarray(rows, dtype=np.uint32)
+
+    @classmethod
+    def from_bitmap(cls, bitmap: np.ndarray) -> PackedSprite:
+        packed = np.packbits(np.asarray(bitmap, dtype=bool), axis=1, bitorder="little")
+        return cls(packed.view("<u4").ravel())
+
+    def to_bitmap(self) -> np.ndarray:
+        packed = self.rows.astype("<u4").view(np.uint8).reshape(-1, 4)
+        return np.unpackbits(packed, axis=1, bitorder="little").view(bool)
+
+    def shift(self, off: int) -> PackedSprite:
+        # Column x of the result is column x + off of this sprite, like the LCD's horizontal offset.
+        if abs(off) >= 32:
+            return PackedSprite(np.zeros_like(self.rows))
+        if off >= 0:
+            return PackedSprite(self.rows >> np.uint32(off))
+        return PackedSprite(self.rows << np.uint32(-off))
+
+    def flip(self, horizontal: bool = True) -> PackedSprite:
+        if horizontal:
+            return PackedSprite.from_bitmap(self.to_bitmap()[:, ::-1])
+        return PackedSprite(self.rows[::-1])
+
+    def __or__(self, other: PackedSprite) -> PackedSprite:
+        return PackedSprite(self.rows | other.rows)
+
+    def __and__(self, other: PackedSprite) -> PackedSprite:
+        return PackedSprite(self.rows & other.rows)
+
+    def __xor__(self, other: PackedSprite) -> PackedSprite:
+        return PackedSprite(self.rows ^ other.rows)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, PackedSprite) and np.array_equal(self.rows, other.rows)
+
+    def __hash__(self) -> int:
+        return hash(self.rows.tobytes())
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        bitmap = self.to_bitmap()
+        return bitmap if dtype is None else bitmap.astype(dtype)
+
+
+Sprite = Union[PackedSprite, np.ndarray]
+
+
+def load_sprite(filename: str) -> PackedSprite:
+    # Pillow is only needed when the atlas has to be rebuilt from the PNG tree.
+    from PIL import Image
 
-def load_sprite(filename: str) -> np.array:
     image = Image.open(filename)
-    image_array = np.array(image)
-    image_array = np.where(image_array == 255, 0, 1)
-    return image_array
+    return PackedSprite.from_bitmap(np.array(image) != 255)
 
 
-def load_animation_sprites(sprite_folder: str, num_frames: int) -> List[np.array]:
+def load_animation_sprites(sprite_folder: str, num_frames: int) -> List[PackedSprite]:
     sprite_images = []
     for frame in range(num_frames):
         filename = os.path.join(sprite_folder, f"{frame}.png")
@@ -24,48 +86,220 @@ def load_animation_sprites(sprite_folder: str, num_frames: int) -> List[np.array
     return sprite_images
 
 
+def sprite_files(key: str, num_frames: int = 1, folder: str = None) -> List[str]:
+    # A key is a path inside the sprite tree, either a single sprite (without .png) or a folder of frames.
+    path = os.path.join(folder or sprite_folder, *key.split("/"))
+    if os.path.isfile(path + ".png"):
+        return [path + ".png"]
+    return [os.path.join(path, f"{frame}.png") for frame in range(num_frames)]
+
+
+def sprite_fingerprint(key: str, num_frames: int = 1, folder: str = None) -> str:
+    # Size and mtime of the key's PNGs, plus its folder so added or removed frames are noticed.
+    digest = hashlib.sha1()
+    path = os.path.join(folder or sprite_folder, *key.split("/"))
+    for filename in [path] + sprite_files(key, num_frames, folder):
+        if os.path.exists(filename):
+            stat = os.stat(filename)
+            digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def discover_sprites(folder: str = None) -> Dict[str, int]:
+    # Maps every key under the sprite tree to its number of frames.
+    folder = folder or sprite_folder
+    keys = {}
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        prefix = os.path.relpath(root, folder).replace(os.sep, "/")
+        prefix = "" if prefix == "." else prefix + "/"
+        frames = [f for f in files if f.endswith(".png") and f[:-4].isdigit()]
+        if "0.png" in frames:
+            keys[prefix.rstrip("/")] = len(frames)
+        for f in sorted(files):
+            if f.endswith(".png") and not f[:-4].isdigit():
+                keys[prefix + f[:-4]] = 1
+    return keys
+
+
+def build_atlas(filename: str = ATLAS_FILE) -> Dict[str, np.ndarray]:
+    keys = discover_sprites()
+    rows = []
+    for key, num_frames in keys.items():
+        rows.extend(load_sprite(f).rows for f in sprite_files(key, num_frames))
+    atlas = {
+        "rows": np.stack(rows),
+        "keys": np.array(list(keys)),
+        "counts": np.array(list(keys.values())),
+        "fingerprints": np.array([sprite_fingerprint(key, n) for key, n in keys.items()]),
+    }
+    try:
+        # Written next to the target and renamed, so a concurrent reader never sees a partial file.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **atlas)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, filename)
+    except OSError:
+        pass
+    return atlas
+
+
+def map_array(filename: str, name: str) -> np.ndarray:
+    # An array stored uncompressed in an .npz, as np.savez writes them, mapped read-only instead of read.
+    # Only the pages that are actually indexed come into memory.
+    with zipfile.ZipFile(filename) as archive:
+        info = archive.getinfo(name + ".npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"{name} is compressed")
+    with open(filename, "rb") as f:
+        # The member's data follows its local header, whose name and extra field lengths end it.
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack("<HH", f.read(4))
+        f.seek(name_length + extra_length, os.SEEK_CUR)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape, order="F" if fortran_order else "C")
+
+
+class SpriteRegistry:
+    # Loads animations on first access from the atlas, keeping at most max_cached of them in memory.
+    # The atlas rows stay mapped from disk, loaded frames are copies, so evicted ones are freed.
+
+    def __init__(self, atlas_file: str = ATLAS_FILE, max_cached: int = 64) -> None:
+        self.atlas_file = atlas_file
+        self.max_cached = max_cached
+        self.cache: OrderedDict[str, List[PackedSprite]] = OrderedDict()
+        self.lock = threading.RLock()
+        self.rows: Optional[np.ndarray] = None
+        self.index: Dict[str, Tuple[int, int, str]] = {}
+        self.rebuilt = False
+
+    def load_index(self, rebuild: bool = False) -> None:
+        atlas = None
+        if not rebuild:
+            try:
+                with np.load(self.atlas_file) as npz:
+                    atlas = {key: npz[key] for key in ("keys", "counts", "fingerprints")}
+                atlas["rows"] = map_array(self.atlas_file, "rows")
+            except (OSError, KeyError, ValueError):
+                atlas = None
+        if atlas is None:
+            # Rebuilding decodes the whole tree anyway, its rows are kept as they are.
+            atlas = build_atlas(self.atlas_file)
+            self.rebuilt = True
+        starts = np.cumsum(atlas["counts"]) - atlas["counts"]
+        self.rows = atlas["rows"]
+        self.index = {
+            str(key): (int(start), int(count), str(fingerprint))
+            for key, start, count, fingerprint in zip(atlas["keys"], starts, atlas["counts"], atlas["fingerprints"])
+        }
+
+    def load(self, key: str) -> List[PackedSprite]:
+        with self.lock:
+            frames = self.cache.get(key)
+            if frames is not None:
+                self.cache.move_to_end(key)
+                return frames
+            if self.rows is None:
+                self.load_index()
+            entry = self.index.get(key)
+            if entry is None and self.rebuilt:
+                raise KeyError(key)
+            if entry is None or sprite_fingerprint(key, entry[1]) != entry[2]:
+                # New or edited PNGs, the atlas is rebuilt and the lookup retried.
+                self.load_index(rebuild=True)
+                entry = self.index.get(key)
+                if entry is None:
+                    raise KeyError(key)
+            start, count, _ = entry
+            frames = [PackedSprite(np.array(rows)) for rows in self.rows[start:start + count]]
+            self.cache[key] = frames
+            if len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+            return frames
+
+    def get(self, name: str) -> Union[PackedSprite, List[PackedSprite]]:
+        # Accepts a name from SPRITES or any key of the sprite tree, e.g. "babies/0/idle".
+        if name not in SPRITES:
+            return self.load(name)
+        key, num_frames, category = SPRITES[name]
+        frames = self.load(key)
+        if category == "component":
+            return frames[0]
+        return [frames[frame % len(frames)] for frame in range(num_frames)]
+
+    def keys(self) -> Iterable[str]:
+        with self.lock:
+            if self.rows is None:
+                self.load_index()
+            return list(self.index)
+
+    def prefetch(self, category: str) -> threading.Thread:
+        names = [name for name, (_, _, cat) in SPRITES.items() if cat == category]
+        thread = threading.Thread(target=lambda: [self.get(name) for name in names], daemon=True)
+        thread.start()
+        return thread
+
+
 # SPRITES
-# Animations
-sprite_folder = "sprites"
-
-# Eggs
-egg_folder = os.path.join(sprite_folder, "eggs", "0")  # TODO: Add more variants.
-IDLE_EGG = load_animation_sprites(egg_folder, 2)
-
-# Babies
-baby_folder = os.path.join(sprite_folder, "babies", "0")
-IDLE_BABY = load_animation_sprites(os.path.join(baby_folder, "idle"), 2)
-SLEEP_BABY = load_animation_sprites(os.path.join(baby_folder, "sleep"), 2)
-
-# Children
-child_folder = os.path.join(sprite_folder, "children", "0")
-IDLE_CHILD = load_animation_sprites(os.path.join(child_folder, "idle"), 2)
-SLEEP_CHILD = load_animation_sprites(os.path.join(child_folder, "sleep"), 2)
-
-# Teen
-teen_folder = os.path.join(sprite_folder, "teens", "0")
-# Adult
-adult_folder = os.path.join(sprite_folder, "adult", "0")
-# Special
-special_folder = os.path.join(sprite_folder, "specials", "0")
-
-# Overlays
-overlay_folder = os.path.join(sprite_folder, "overlay")
-OVERLAY_ZZZ = load_animation_sprites(os.path.join(overlay_folder, "OVERLAY_ZZZ"), 2)
-OVERLAY_EAT = load_animation_sprites(os.path.join(overlay_folder, "EAT", "apple"), 6)  # TODO: Add more foods
-OVERLAY_STINK = load_animation_sprites(os.path.join(overlay_folder, "OVERLAY_STINK"), 2)
-OVERLAY_DEAD = load_animation_sprites(os.path.join(overlay_folder, "OVERLAY_DEAD"), 2)
-OVERLAY_EXCLAIM = load_animation_sprites(os.path.join(overlay_folder, "OVERLAY_EXCLAIM"), 2)
-OVERLAY_CLEAN = load_sprite(os.path.join(sprite_folder, "OVERLAY", "OVERLAY_CLEAN.png"))
-
-# Components
-SELECTOR = load_sprite(os.path.join(sprite_folder, "components", "SELECTOR.png"))
-FEED = load_sprite(os.path.join(sprite_folder, "components", "FEED.png"))
-FLUSH = load_sprite(os.path.join(sprite_folder, "components", "FLUSH.png"))
-HEALTH = load_sprite(os.path.join(sprite_folder, "components", "HEALTH.png"))
-ZZZ = load_sprite(os.path.join(sprite_folder, "components", "ZZZ.png"))
-DISPLAY_HUNGER = load_sprite(os.path.join(sprite_folder, "components", "DISPLAY_HUNGER.png"))
-DISPLAY_ENERGY = load_sprite(os.path.join(sprite_folder, "components", "DISPLAY_ENERGY.png"))
-DISPLAY_WASTE = load_sprite(os.path.join(sprite_folder, "components", "DISPLAY_WASTE.png"))
-DISPLAY_AGE = load_sprite(os.path.join(sprite_folder, "components", "DISPLAY_AGE.png"))
-DISPLAY_BACK = load_sprite(os.path.join(sprite_folder, "components", "DISPLAY_BACK.png"))
+# name: (key inside sprite_folder, number of frames, category)
+# Components are single sprites, everything else is a list of animation frames.
+SPRITES: Dict[str, Tuple[str, int, str]] = {
+    # Eggs
+    "IDLE_EGG": ("eggs/0", 2, "egg"),  # TODO: Add more variants.
+    # Babies
+    "IDLE_BABY": ("babies/0/idle", 2, "baby"),
+    "SLEEP_BABY": ("babies/0/sleep", 2, "baby"),
+    # Children
+    "IDLE_CHILD": ("children/0/idle", 2, "child"),
+    "SLEEP_CHILD": ("children/0/sleep", 2, "child"),
+    # Teen, adult and special sprites will live in teens/0, adult/0 and specials/0.
+    # Overlays
+    "OVERLAY_ZZZ": ("overlay/OVERLAY_ZZZ", 2, "overlay"),
+    "OVERLAY_EAT": ("overlay/EAT/apple", 6, "overlay"),  # TODO: Add more foods
+    "OVERLAY_STINK": ("overlay/OVERLAY_STINK", 2, "overlay"),
+    "OVERLAY_DEAD": ("overlay/OVERLAY_DEAD", 2, "overlay"),
+    "OVERLAY_EXCLAIM": ("overlay/OVERLAY_EXCLAIM", 2, "overlay"),
+    # A single sprite, the LCD offset scrolls it. Its frame counter still runs to 32, see simulation.FRAME_CYCLES.
+    "OVERLAY_CLEAN": ("overlay/OVERLAY_CLEAN", 1, "overlay"),
+    # Components
+    "SELECTOR": ("components/SELECTOR", 1, "component"),
+    "FEED": ("components/FEED", 1, "component"),
+    "FLUSH": ("components/FLUSH", 1, "component"),
+    "HEALTH": ("components/HEALTH", 1, "component"),
+    "ZZZ": ("components/ZZZ", 1, "component"),
+    "DISPLAY_HUNGER": ("components/DISPLAY_HUNGER", 1, "component"),
+    "DISPLAY_ENERGY": ("components/DISPLAY_ENERGY", 1, "component"),
+    "DISPLAY_WASTE": ("components/DISPLAY_WASTE", 1, "component"),
+    "DISPLAY_AGE": ("components/DISPLAY_AGE", 1, "component"),
+    "DISPLAY_BACK": ("components/DISPLAY_BACK", 1, "component"),
+}
+
+# Stage whose animations are worth prefetching while the pet is in the given one.
+NEXT_STAGE = {"egg": "baby", "baby": "child", "child": "teen", "teen": "adult", "adult": "special"}
+
+registry = SpriteRegistry()
+
+
+def get(name: str) -> Union[PackedSprite, List[PackedSprite]]:
+    return registry.get(name)
+
+
+def prefetch(category: str) -> threading.Thread:
+    return registry.prefetch(category)
+
+
+def __getattr__(name: str) -> Union[PackedSprite, List[PackedSprite]]:
+    # Every entry of SPRITES reads like a module global, e.g. sh.IDLE_EGG or sh.FEED.
+    if name in SPRITES:
+        return registry.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    build_atlas()
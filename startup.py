@@ -0,0 +1,7 @@
+from __future__ import annotations
+
+import time
+
+# When the game started, taken as the first thing tamagotchi.py imports and before numpy and pygame
+# are loaded. Kept in its own module so that import can come ahead of all the others.
+STARTED = time.perf_counter()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import itertools
+import os
+
+import numpy as np
+
+import simulation as sim
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from population import Population
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Constants of simulation.py a sweep may override, the ones Population reads.
+BALANCE = (
+    "AGE_HATCH",
+    "AGE_CHILD",
+    "AGE_DEATHFROMNATURALCAUSES",
+    "HUNGER_NEEDSTOEAT",
+    "HUNGER_DEADFROMNOTEATING",
+    "ENERGY_TIRED",
+    "ENERGY_PASSOUT",
+    "WASTE_EXPUNGE",
+)
+
+RESULTS = (
+    "ticks",
+    "alive",
+    "died_hunger",
+    "died_age",
+    "lifespan_mean",
+    "lifespan_p5",
+    "lifespan_p50",
+    "lifespan_p95",
+    "first_exclaim_mean",
+    "passouts_mean",
+)
+# Care probabilities of a run, see Population.
+CARE = ("feed_prob", "clean_prob", "sleep_prob")
+
+
+def grid(values: Dict[str, Iterable[int]]) -> List[Dict[str, int]]:
+    names = list(values)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(values[name] for name in names))]
+
+
+def random_sample(ranges: Dict[str, Tuple[int, int]], n: int, seed: int = 0) -> List[Dict[str, int]]:
+    # Uniform integer samples, both ends of each range included.
+    rng = np.random.default_rng(seed)
+    return [{name: int(rng.integers(lo, hi + 1)) for name, (lo, hi) in ranges.items()} for _ in range(n)]
+
+
+def run_point(params: Dict[str, int], seed: int, pets: int, max_ticks: int, care: Tuple[float, float, float]) -> Dict:
+    # Runs in a worker process, so overriding the simulation constants only affects this point.
+    for name in params:
+        if name not in BALANCE:
+            raise ValueError(f"{name} is not a balancing constant")
+    defaults = {name: getattr(sim, name) for name in params}
+    try:
+        for name, value in params.items():
+            setattr(sim, name, value)
+        population = Population(pets, seed, *care)
+        population.run(max_ticks)
+        summary = population.summary()
+    finally:
+        for name, value in defaults.items():
+            setattr(sim, name, value)
+    lifespan = summary["lifespan_percentiles"]
+    return {
+        "ticks": summary["ticks"],
+        "alive": summary["alive"],
+        "died_hunger": summary["causes"]["hunger"],
+        "died_age": summary["causes"]["age"],
+        "lifespan_mean": summary["lifespan_mean"],
+        "lifespan_p5": lifespan.get("p5", ""),
+        "lifespan_p50": lifespan.get("p50", ""),
+        "lifespan_p95": lifespan.get("p95", ""),
+        "first_exclaim_mean": summary["first_exclaim_mean"],
+        "passouts_mean": summary["passouts_mean"],
+    }
+
+
+def completed(out_file: str, columns: List[str]) -> Optional[Dict[int, Dict[str, str]]]:
+    # Rows already in the output file, keyed by point index, so an interrupted sweep can resume. None
+    # for a new or empty file. Rows are only appended under the same columns.
+    if not os.path.exists(out_file) or os.path.getsize(out_file) == 0:
+        return None
+    with open(out_file, newline="") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames != columns:
+            raise ValueError(
+                f"{out_file} has the columns {','.join(reader.fieldnames or [])}, this sweep writes {','.join(columns)}"
+            )
+        return {int(row["index"]): row for row in reader}
+
+
+def sweep(
+    points: List[Dict[str, int]],
+    out_file: str,
+    pets: int = 10000,
+    max_ticks: int = 20000,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    care: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+) -> None:
+    # Every point gets its own seed from seed, so results do not depend on which worker ran them.
+    names = sorted({name for point in points for name in point})
+    columns = ["index", "seed", *names, "pets", "max_ticks", *CARE, *RESULTS]
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(len(points))]
+    done = completed(out_file, columns)
+    new_file = done is None
+    done = done or {}
+    # Rows of a run with other settings would end up mixed with these, such a file is not resumed.
+    settings = {"pets": pets, "max_ticks": max_ticks, **{name: float(p) for name, p in zip(CARE, care)}}
+    for index, row in done.items():
+        expected = {**settings, "seed": seeds[index]} if index < len(points) else settings
+        for name, value in expected.items():
+            if row[name] != str(value):
+                raise ValueError(f"{out_file} was written with {name}={row[name]}, this sweep uses {value}")
+    todo = [
+        index
+        for index, point in enumerate(points)
+        if index not in done or any(done[index].get(name) != str(value) for name, value in point.items())
+    ]
+    with open(out_file, "a", newline="") as f, ProcessPoolExecutor(workers) as pool:
+        writer = csv.DictWriter(f, columns)
+        if new_file:
+            writer.writeheader()
+        futures = {
+            pool.submit(run_point, points[index], seeds[index], pets, max_ticks, care): index for index in todo
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            row = {"index": index, "seed": seeds[index], **points[index], **settings, **future.result()}
+            writer.writerow(row)
+            f.flush()
+
+
+def parse_values(spec: str) -> Tuple[str, str]:
+    name, _, values = spec.partition("=")
+    if name not in BALANCE or not values:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUES with NAME one of {', '.join(BALANCE)}")
+    return name, values
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sweep balancing constants over simulated pet populations.")
+    parser.add_argument("out_file", help="CSV file results are appended to, existing rows are skipped")
+    parser.add_argument("--grid", type=parse_values, action="append", default=[], help="NAME=v1,v2,...")
+    parser.add_argument("--range", type=parse_values, action="append", default=[], help="NAME=lo:hi")
+    parser.add_argument("--samples", type=int, default=0, help="random points drawn from the --range values")
+    parser.add_argument("--pets", type=int, default=10000)
+    parser.add_argument("--max-ticks", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--care", type=float, nargs=3, default=(0.0, 0.0, 0.0), metavar=("FEED", "CLEAN", "SLEEP"))
+    args = parser.parse_args()
+    if args.range and not args.samples:
+        parser.error("--range needs --samples")
+
+    points = grid({name: [int(v) for v in values.split(",")] for name, values in args.grid}) if args.grid else []
+    if args.samples:
+        ranges = {name: tuple(int(v) for v in values.split(":")) for name, values in args.range}
+        points += random_sample(ranges, args.samples, args.seed)
+    try:
+        sweep(points or [{}], args.out_file, args.pets, args.max_ticks, args.seed, args.workers, tuple(args.care))
+    except ValueError as exc:
+        parser.error(str(exc))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,30 @@
 from __future__ import annotations
 
+# Imported first, the startup timeline counts from before numpy and pygame are loaded.
+from startup import STARTED
+
+import json
+import math
 import numpy as np
 import os
 import platform
 import pygame
-import random
 import sys
+import time
+import warnings
 
-from pygame.locals import QUIT, KEYDOWN, K_LEFT, K_DOWN, K_RIGHT, USEREVENT
+from pygame.locals import QUIT, KEYDOWN, K_LEFT, K_DOWN, K_RIGHT, K_b, K_t, NOEVENT, VIDEOEXPOSE
 
+import game_clock
+import profiler
 import sprite_handler as sh
 
-from typing import List, Tuple
+from persistence import SaveStore
+from replay import Recording
+from simulation import DOWN, HUNGER_SICKFROMNOTEATING, LEFT, RIGHT, STAGES, PetSimulation
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 
 
 if platform.system() == "Windows":
@@ -20,342 +33,457 @@ if platform.system() == "Windows":
 Screen = pygame.Surface
 UserEvent = int
 
-# Used "y = round((98.3415 * x + 128) / 8) * 8" to plot ages, subject to change for balancing.
-AGE_HATCH = 128
-AGE_CHILD = 816  # Original: 796. Appx. 7 yo
-AGE_TEEN = 1408  # Appx. 13 yo
-AGE_ADULT = 2584  # Appx 25 yo
-AGE_SPECIAL = 5048  # Appx 50 yo
-AGE_DEATHFROMNATURALCAUSES = 8192  # Appx. 82 yo, original number
-
-HUNGER_CANEAT = 32
-HUNGER_NEEDSTOEAT = 128
-HUNGER_SICKFROMNOTEATING = 256
-HUNGER_DEADFROMNOTEATING = 512
-ENERGY_CANSLEEP = 150
-ENERGY_TIRED = 64
-ENERGY_PASSOUT = 8
-WASTE_EXPUNGE = 256
-
 BG_COLOR = (160, 178, 129)
 PIXEL_COLOR = (10, 12, 6)
 NONPIXEL_COLOR = (156, 170, 125)
 TRANSPARENT_COLOR = (0, 0, 0, 0)
 
+# The LCD and the components are 8-bit surfaces drawn with these palette indices, the colors come from
+# the theme, see theme_palette(). Pixels of TRANSPARENT_INDEX are left out when blitting.
+BG_INDEX = 0
+NONPIXEL_INDEX = 1
+PIXEL_INDEX = 2
+TRANSPARENT_INDEX = 3
+# Themes as {"name": {"background": [r, g, b], "unlit": [r, g, b], "lit": [r, g, b]}}, "classic" is
+# the colors above. T cycles through the themes and B toggles the backlight while playing.
+THEMES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "themes.json")
+THEME = "classic"
+BACKLIGHT = 0.35
+# Color a sick pet's LCD is tinted towards, and how far.
+SICK_TINT = ((120, 150, 40), 0.3)
+
+# Frame rate of the perf readouts, otherwise the loop sleeps until the next game step or input.
 FPS = 30
-SECOND = 1000
+# Game time per real time, raise to fast-forward while testing.
+TIME_SCALE = 1.0
 SCREEN_WIDTH = 450
 SCREEN_HEIGHT = 400
+# Finished LCD pictures kept for reuse, enough for every animation, overlay and offset of a stage.
+DISPLAY_CACHE_SIZE = 512
+# Adds FPS, frame time and game tick time below the debug stats.
+SHOW_PERF = False
+# Times every phase of the game loop, draws the last frames as a graph below the debug stats and
+# writes a Chrome trace to profiler.TRACE_FILE on exit.
+PROFILE = False
+# Only starts the display and font modules, draws the first frame before the HUD font is loaded and
+# looks the font up in FONT_CACHE_FILE instead of scanning the system fonts on every start.
+FAST_START = True
+# Prints how long each step of startup took.
+SHOW_STARTUP = False
+FONT_NAME = "Arial"
+FONT_SIZE = 14
+FONT_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "font_cache.json")
+# Saves every session to RECORDINGS_FOLDER, to be checked with replay.py.
+RECORD_INPUTS = False
+RECORDINGS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+COMPONENTS_RECT = pygame.Rect(0, 16, SCREEN_WIDTH, 32)
+DISPLAY_RECT = pygame.Rect(32, 64, 320, 320)
+# The title, five stats and four perf readouts on a 10px pitch, the last line is a whole font tall.
+DEBUG_LINES = 10
+DEBUG_RECT = pygame.Rect(360, 60, SCREEN_WIDTH - 360, (DEBUG_LINES - 1) * 10 + FONT_SIZE * 3 // 2)
+GRAPH_RECT = pygame.Rect(360, 300, SCREEN_WIDTH - 360, 80)
+
+BUTTONS = {K_LEFT: LEFT, K_DOWN: DOWN, K_RIGHT: RIGHT}
+COMPONENTS = ("FEED", "FLUSH", "HEALTH", "ZZZ")
+component_cache: dict[tuple, Screen] = {}
+component_palette: List[Tuple[int, int, int]] = [BG_COLOR, NONPIXEL_COLOR, PIXEL_COLOR, (255, 0, 255)]
+
+
+def compose_display(image_data: sh.Sprite, off=0, percv=0) -> np.ndarray:
+    # Builds the lit/unlit 32x32 LCD bitmap, column x of the screen shows column x + off of the sprite.
+    if not isinstance(image_data, sh.PackedSprite):
+        image_data = sh.PackedSprite.from_bitmap(image_data)
+    if percv > 0:
+        # The progress bar lights sprite columns 2 < x < 3 + percv on rows 12 to 16.
+        bar = np.zeros(32, dtype=np.uint32)
+        bar[12:17] = (1 << min(32, math.ceil(3 + percv))) - (1 << 3)
+        image_data = image_data | sh.PackedSprite(bar)
+    return image_data.shift(off).to_bitmap()
 
 
 def render_display(
     screen: pygame.Surface,
-    image_data: np.ndarray,
+    image_data: sh.Sprite,
     fg_color: Tuple[int, int, int],
     bg_color: Tuple[int, int, int],
     off=0,
     percv=0,
+    pos: Tuple[int, int] = DISPLAY_RECT.topleft,
 ) -> None:
-    for y in range(32):
-        for x in range(off, 32 + off):
-            color = bg_color
-            if x in range(len(image_data[y])):
-                if image_data[y][x] or (percv > 0 and 11 < y < 17 and 2 < x < 3 + percv):
-                    color = fg_color
-            pygame.draw.rect(screen, color, ((x - off) * 10 + 32, y * 10 + 64, 8, 8))
+    bitmap = compose_display(image_data, off, percv)
+    palette = np.array([bg_color, fg_color], dtype=np.uint8)
+    # Each LCD pixel is an 8x8 cell on a 10px pitch, the 2px gaps keep whatever is already on screen.
+    x, y = pos
+    pixels = pygame.surfarray.pixels3d(screen)
+    cells = pixels[x:x + 320, y:y + 320].reshape(32, 10, 32, 10, 3)
+    cells[:, :8, :, :8] = palette[bitmap.T.astype(np.intp)][:, None, :, None]
+    del cells, pixels
+
+
+def render_display_indexed(surface: pygame.Surface, image_data: sh.Sprite, off=0, percv=0) -> None:
+    # Draws the whole LCD, gaps included, as palette indices into an 8-bit surface of DISPLAY_RECT's size.
+    bitmap = compose_display(image_data, off, percv)
+    pixels = pygame.surfarray.pixels2d(surface)
+    pixels[:] = BG_INDEX
+    cells = pixels.reshape(32, 10, 32, 10)
+    cells[:, :8, :, :8] = np.where(bitmap.T, PIXEL_INDEX, NONPIXEL_INDEX)[:, None, :, None]
+    del cells, pixels
+
+
+def load_themes(filename: str = THEMES_FILE) -> Dict[str, List[Tuple[int, int, int]]]:
+    # Background, unlit and lit colors of every theme, in palette index order.
+    # A file that cannot be read or a theme without valid colors leaves only the built-in "classic".
+    themes = {"classic": [BG_COLOR, NONPIXEL_COLOR, PIXEL_COLOR]}
+    try:
+        with open(filename) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return themes
+    except (OSError, ValueError) as exc:
+        warnings.warn(f"ignoring {filename}: {exc}")
+        return themes
+    try:
+        for name, colors in config.items():
+            themes[name] = [tuple(colors[part]) for part in ("background", "unlit", "lit")]
+            if not all(len(color) == 3 and all(0 <= channel <= 255 for channel in color) for color in themes[name]):
+                raise ValueError(f"colors of {name} are not [r, g, b] from 0 to 255")
+    except (AttributeError, KeyError, TypeError, ValueError) as exc:
+        warnings.warn(f"ignoring {filename}: {exc!r}")
+        return {"classic": themes["classic"]}
+    return themes
+
+
+def theme_palette(
+    colors: List[Tuple[int, int, int]],
+    backlight: float = 0.0,
+    tint: Optional[Tuple[int, int, int]] = None,
+    tint_amount: float = 0.0,
+) -> List[Tuple[int, int, int]]:
+    # The palette of the 8-bit surfaces: the theme colors mixed towards white by backlight and towards
+    # tint by tint_amount, then the transparent entry. The lit color only takes the tint.
+    palette = []
+    for index, color in enumerate(colors):
+        mixed = np.array(color, dtype=float)
+        if index != PIXEL_INDEX:
+            mixed += (255 - mixed) * backlight
+        if tint is not None:
+            mixed += (np.array(tint) - mixed) * tint_amount
+        palette.append(tuple(int(round(channel)) for channel in mixed))
+    return palette + [(255, 0, 255)]
+
+
+class DisplayCache:
+    # Finished 8-bit LCD surfaces keyed by PetSimulation.display_key(), so showing a picture that was
+    # shown before is a single blit. Keeps the max_cached most recently used ones. A new palette is
+    # applied to the cached surfaces as they are, nothing is drawn again.
+
+    def __init__(self, max_cached: int = DISPLAY_CACHE_SIZE, palette: Optional[list] = None) -> None:
+        self.max_cached = max_cached
+        self.palette = palette or theme_palette([BG_COLOR, NONPIXEL_COLOR, PIXEL_COLOR])
+        self.cache: OrderedDict[tuple, Screen] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sim: PetSimulation) -> Screen:
+        key = sim.display_key()
+        surface = self.cache.get(key)
+        if surface is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = pygame.Surface(DISPLAY_RECT.size, 0, 8)
+        surface.set_palette(self.palette)
+        sprite, off, percv = sim.display()
+        render_display_indexed(surface, sprite, off, percv)
+        self.cache[key] = surface
+        if len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+        return surface
+
+    def set_palette(self, palette: list) -> None:
+        self.palette = palette
+        for surface in self.cache.values():
+            surface.set_palette(palette)
+
+    def hit_rate(self) -> float:
+        return self.hits / max(1, self.hits + self.misses)
 
 
 def render_component(
     surface: Screen,
-    image_data: np.ndarray,
+    image_data: sh.Sprite,
     fg_color: Tuple[int, int, int],
     bg_color: Tuple[int, int, int] = (255, 255, 255),
 ) -> None:
-    pixels = pygame.PixelArray(surface)
-    for y in range(surface.get_height()):
-        for x, bit in enumerate(image_data[y]):
-            pixels[x][y] = fg_color if bit else bg_color
+    image = np.asarray(image_data, dtype=bool)
+    pixels = pygame.surfarray.pixels2d(surface)
+    pixels[:] = np.where(image.T, surface.map_rgb(fg_color), surface.map_rgb(bg_color))
     del pixels
 
 
-def do_cycle(pet: dict, stage: int) -> None:
-    pet["age"] += 2
-    if stage != 0:
-        choice = random.choice(["hunger", "energy", "energy", "waste", "happiness", "happiness"])
-        if random.randint(0, 31) < 5:
-            if choice in ("energy", "happiness"):
-                pet[choice] += random.choice([-2, 0])
-            else:
-                pet[choice] += 2
-
-        if choice != "hunger":
-            pet["hunger"] += 1
-        if choice != "waste":
-            pet["waste"] += 1
-        if choice != "energy":
-            pet["energy"] -= 1
-
-        if pet["waste"] >= WASTE_EXPUNGE:
-            pet["happiness"] -= 1
-
-
-def get_offset(off: int) -> int:
-    if -3 <= off <= 3:
-        return random.choice([-1, 0, 1]) + off
-    elif off < -3:
-        return random.choice([0, 1]) + off
-    else:
-        return random.choice([-1, 0]) + off
-
-
-def get_next_frame(animation_frames: List[np.ndarray], current_frame: int) -> int:
-    return (current_frame + 1) % len(animation_frames)
-
-
-def trigger_death(stage: int) -> Tuple[int, int, bool, bool]:
-    if stage == 1:
-        current_anim = sh.SLEEP_BABY
-    elif stage == 2:
-        current_anim = sh.SLEEP_CHILD
-    overlay_anim = sh.OVERLAY_DEAD
-    return current_anim, overlay_anim, True, True
-
-
-def trigger_sleep(stage: int) -> Tuple[int, int, bool, bool]:
-    if stage == 1:
-        current_anim = sh.SLEEP_BABY
-    elif stage == 2:
-        current_anim = sh.SLEEP_CHILD
-    overlay_anim = sh.OVERLAY_ZZZ
-    return current_anim, overlay_anim, True, True
-
-
-def update_page(spid: int) -> int:
-    if spid == 0:
-        stats_page = sh.DISPLAY_HUNGER
-    elif spid == 1:
-        stats_page = sh.DISPLAY_AGE
-    elif spid == 2:
-        stats_page = sh.DISPLAY_WASTE
-    elif spid == 3:
-        stats_page = sh.DISPLAY_ENERGY
-    elif spid == 4:
-        stats_page = sh.DISPLAY_BACK
-    return stats_page
+def get_component(name: str, transparent: bool = False, flip: bool = True) -> Screen:
+    # Component surfaces are rendered once per (sprite, transparency, flip) as 8-bit surfaces in the
+    # current palette, unlit pixels are left out when transparent.
+    key = (name, transparent, flip)
+    surface = component_cache.get(key)
+    if surface is None:
+        surface = pygame.Surface((32, 32), 0, 8)
+        surface.set_palette(component_palette)
+        pixels = pygame.surfarray.pixels2d(surface)
+        pixels[:] = np.where(np.asarray(getattr(sh, name), dtype=bool).T, PIXEL_INDEX, NONPIXEL_INDEX)
+        if transparent:
+            pixels[pixels == NONPIXEL_INDEX] = TRANSPARENT_INDEX
+        del pixels
+        if flip:
+            surface = pygame.transform.flip(surface, True, False)
+        if transparent:
+            surface.set_colorkey(TRANSPARENT_INDEX)
+        component_cache[key] = surface
+    return surface
+
+
+def prebake_components() -> None:
+    # Call again after a skin change, the old surfaces are dropped first.
+    component_cache.clear()
+    for name in COMPONENTS:
+        get_component(name)
+    get_component("SELECTOR", transparent=True)
+
+
+def set_palette(palette: list, display_cache: DisplayCache) -> None:
+    # Applies a theme or effect palette to every cached surface, in time proportional to the palette.
+    component_palette[:] = palette
+    for surface in component_cache.values():
+        surface.set_palette(palette)
+    display_cache.set_palette(palette)
+
+
+def find_font(name: str) -> Optional[str]:
+    # Resolving a system font can mean listing every installed font, so the path is kept in
+    # FONT_CACHE_FILE. None is pygame's bundled default font, as with SysFont.
+    try:
+        with open(FONT_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    path = cache.get(name, "")
+    if path is None or (path and os.path.exists(path)):
+        return path
+    path = pygame.font.match_font(name)
+    cache[name] = path
+    try:
+        with open(FONT_CACHE_FILE, "w") as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+    return path
+
+
+@lru_cache(maxsize=256)
+def render_text(font: pygame.font.Font, text: str, color: Tuple[int, int, int]) -> Screen:
+    # The HUD text only changes once per tick, rendered strings are reused until evicted.
+    return font.render(text, True, color)
 
 
 def main():
-    pygame.init()
+    timeline = [("imports", time.perf_counter())]
+    if FAST_START:
+        pygame.display.init()
+        pygame.font.init()
+    else:
+        pygame.init()
+    # pygame.init() would start SDL's timer, FAST_START leaves that to the Clock. pygame.time.get_ticks()
+    # returns 0 until then, so the clock is made before anything reads the time.
     clock = pygame.time.Clock()
     screen: Screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), 0, 32)
     pygame.display.set_caption("Tamagotchi")
-    font = pygame.font.SysFont("Arial", 14)
-    selector_img = pygame.Surface((32, 32)).convert_alpha()
-    render_component(selector_img, sh.SELECTOR, PIXEL_COLOR, TRANSPARENT_COLOR)
-    pygame.time.set_timer(USEREVENT + 1, SECOND)
-
-    # Tamagotchi
-    pet: dict[str, int] = {
-        "hunger": 0,
-        "energy": 8,
-        "waste": 0,
-        "age": 0,
-        "happiness": 0,
-    }
-
-    # Counters
-    # off is the horizontal offset
-    off: int = 0
-    # selid is the selected button
-    selid: int = 0  # TODO: Remove when buttons have been removed.
-    # spid is the selected page
-    spid: int = 0  # TODO: This will probably need to be modified.
-    stage: int = 0
-    frame: int = 0
-    ol_frame: int = 0
-
-    # Flags
-    stats: bool = False
-    has_overlay: bool = False
-    cleaning: bool = False
-    eating: bool = False
-    stats: bool = False
-    sleeping: bool = False
-    dead: bool = False
-    update_game: bool = False
-
-    current_anim: int = sh.IDLE_EGG
-    overlay_anim: int = sh.OVERLAY_ZZZ
-    stats_page: int = sh.DISPLAY_HUNGER
+    timeline.append(("display", time.perf_counter()))
+    # With FAST_START the HUD font is loaded once the first frame is up, the HUD waits for it.
+    font = None if FAST_START else pygame.font.SysFont(FONT_NAME, FONT_SIZE)
+    themes = load_themes()
+    theme = THEME if THEME in themes else "classic"
+    backlight = False
+    palette = theme_palette(themes[theme])
+    component_palette[:] = palette
+    prebake_components()
+
+    # The pet lives on while the game is closed, the time since the last save is caught up on first.
+    store = SaveStore()
+    sim = store.restore() or PetSimulation()
+    if store.saved_at:
+        sim.fast_forward(int((time.time() - store.saved_at) * 1000))
+    store.start()
+    timeline.append(("save", time.perf_counter()))
+    recording = Recording.begin(sim, int.from_bytes(os.urandom(8), "little")) if RECORD_INPUTS else None
+    stage: int = sim.stage
+    tick_ms: float = 0
+    frame_ms: float = 0
+    clock_ms: int = pygame.time.get_ticks()
+    game_time = game_clock.GameClock(time_scale=TIME_SCALE)
+    events: List[pygame.event.Event] = []
+
+    # Render state
+    # drawn holds the inputs each screen region was last rendered from.
+    drawn: dict[str, object] = {}
+    exposed: bool = True
+    starting: bool = True
+    display_cache = DisplayCache(palette=palette)
+    prof = profiler.FrameProfiler() if PROFILE else None
 
     # Game loop
     while True:
-        screen.fill(BG_COLOR)
+        frame_start = time.perf_counter()
 
         # Event handler
-        for event in pygame.event.get():
+        if prof:
+            prof.begin(profiler.EVENTS)
+        for event in events + pygame.event.get():
             if event.type == QUIT:
+                if prof:
+                    prof.dump()
+                store.close(sim)
+                if recording:
+                    recording.finish(sim)
+                    os.makedirs(RECORDINGS_FOLDER, exist_ok=True)
+                    recording.save(os.path.join(RECORDINGS_FOLDER, time.strftime("%Y%m%d-%H%M%S.rec")))
                 pygame.quit()
                 sys.exit()
             elif event.type == KEYDOWN:
-                if event.key == K_LEFT:
-                    if stats:
-                        spid -= 1
-                        if spid <= -1:
-                            spid = 4
-                        stats_page = update_page(spid)
-                    else:
-                        selid -= 1
-                        if selid <= -1:
-                            spid = 4
-                        stats_page = update_page(spid)
-                elif event.key == K_DOWN:
-                    if stage > 0 or selid == 2:
-                        if selid == 0:
-                            eating = True
-                            overlay_anim = sh.OVERLAY_EAT
-                            ol_frame = 0
-                            has_overlay = True
-                        elif selid == 1:
-                            cleaning = True
-                            overlay_anim = sh.OVERLAY_CLEAN
-                            ol_frame = 0
-                            has_overlay = True
-                        elif selid == 2:
-                            stats = not stats
-                        elif selid == 3:
-                            if pet["energy"] <= ENERGY_CANSLEEP:
-                                (
-                                    current_anim,
-                                    overlay_anim,
-                                    sleeping,
-                                    has_overlay,
-                                ) = trigger_sleep(stage)
-                elif event.key == K_RIGHT:
-                    if stats:
-                        spid += 1
-                        spid %= 5
-                        stats_page = update_page(spid)
-                    else:
-                        selid += 1
-                        selid %= 4
-            elif event.type == USEREVENT + 1:
-                if cleaning:
-                    pygame.time.set_timer(USEREVENT + 1, int(SECOND / 10))
-                update_game = True
+                if event.key in BUTTONS:
+                    sim.press(BUTTONS[event.key])
+                    store.record_press(BUTTONS[event.key])
+                    if recording:
+                        recording.press(sim, BUTTONS[event.key])
+                elif event.key == K_t:
+                    names = list(themes)
+                    theme = names[(names.index(theme) + 1) % len(names)]
+                elif event.key == K_b:
+                    backlight = not backlight
+            elif event.type == VIDEOEXPOSE:
+                exposed = True
 
         # Game logic
-        if update_game:
-            if stage == 0 and pet["age"] > AGE_HATCH:
-                stage += 1
-                current_anim = sh.IDLE_BABY
-                has_overlay = False
-            if stage == 1 and pet["age"] > AGE_CHILD:
-                stage += 1
-                current_anim = sh.IDLE_CHILD
-            if eating and ol_frame == len(overlay_anim) - 1:
-                eating = False
-                has_overlay = False
-                ol_frame = 0
-                pet["hunger"] = 0
-            if sleeping:
-                pet["energy"] += 8
-                if pet["energy"] >= 256:
-                    sleeping = False
-                    has_overlay = False
-                    if stage == 0:
-                        current_anim = sh.IDLE_EGG
-                    elif stage == 1:
-                        current_anim = sh.IDLE_BABY
-                    elif stage == 2:
-                        current_anim = sh.IDLE_CHILD
-            if cleaning:
-                off -= 1
-                if off == -33:
-                    off = 0
-                    cleaning = False
-                    has_overlay = False
-                    pet["waste"] = 0
-                    pygame.time.set_timer(USEREVENT + 1, SECOND)
-            else:
-                if not dead:
-                    frame = get_next_frame(current_anim, frame)
-                    off = get_offset(off)
-                    do_cycle(pet, stage)
-                    if pet["energy"] < ENERGY_PASSOUT and stage > 0:
-                        pet["happiness"] -= 64
-                        current_anim, overlay_anim, sleeping, has_overlay = trigger_sleep(stage)
-
-            if not any([sleeping, cleaning, eating, dead]):
-                if pet["waste"] >= WASTE_EXPUNGE:
-                    overlay_anim = sh.OVERLAY_STINK
-                    has_overlay = True
-                elif (
-                    pet["energy"] <= ENERGY_TIRED
-                    or pet["hunger"] >= HUNGER_NEEDSTOEAT
-                    or pet["waste"] >= WASTE_EXPUNGE - WASTE_EXPUNGE / 3
-                ):
-                    overlay_anim = sh.OVERLAY_EXCLAIM
-                    has_overlay = True
-                if not dead and (
-                        pet["hunger"] >= HUNGER_DEADFROMNOTEATING
-                        or pet["age"] >= AGE_DEATHFROMNATURALCAUSES
-                ):
-                    off = 3
-                    current_anim, overlay_anim, dead, has_overlay = trigger_death(stage)
-
-            if has_overlay:
-                ol_frame = get_next_frame(overlay_anim, ol_frame)
-            update_game = False
+        if prof:
+            prof.begin(profiler.LOGIC)
+        # Game time advances by the real time since the last frame, however late the frame came.
+        now = pygame.time.get_ticks()
+        for step in game_time.advance(now - clock_ms):
+            if step == game_clock.ANIMATION:
+                sim.animate()
+                continue
+            tick_start = time.perf_counter()
+            sim.tick()
+            store.record_tick(sim)
+            if sim.stage != stage:
+                stage = sim.stage
+                sh.prefetch(sh.NEXT_STAGE[STAGES[stage]])
+            tick_ms = (time.perf_counter() - tick_start) * 1000
+        clock_ms = now
+
+        dirty: List[pygame.Rect] = []
+
+        # A theme or effect change only swaps the palette, the cached surfaces are blitted again as they are.
+        sick = sim.pet["hunger"] >= HUNGER_SICKFROMNOTEATING and not sim.dead
+        if drawn.get("palette") != (theme, backlight, sick):
+            tint, tint_amount = SICK_TINT if sick else (None, 0.0)
+            palette = theme_palette(themes[theme], BACKLIGHT if backlight else 0.0, tint, tint_amount)
+            set_palette(palette, display_cache)
+            screen.fill(palette[BG_INDEX])
+            drawn = {"palette": (theme, backlight, sick)}
+            exposed = True
 
         # Render components
-        zipped = zip([sh.FEED, sh.FLUSH, sh.HEALTH, sh.ZZZ], [i for i in range(79, 335, 64)])
-        z = list(zipped)
-        for i in range(len(z)):
-            img = pygame.Surface((32, 32))
-            render_component(img, z[i][0], PIXEL_COLOR, NONPIXEL_COLOR)
-            screen.blit(pygame.transform.flip(img, True, False), (z[i][1], 16))
-
-        # Render selector
-        screen.blit(
-            pygame.transform.flip(selector_img, True, False), (79 + (selid * 64), 16)
-        )
+        if prof:
+            prof.begin(profiler.COMPONENTS)
+        if drawn.get("components") != sim.selid:
+            drawn["components"] = sim.selid
+            screen.fill(palette[BG_INDEX], COMPONENTS_RECT)
+            for name, x in zip(COMPONENTS, range(79, 335, 64)):
+                screen.blit(get_component(name), (x, 16))
+
+            # Render selector
+            screen.blit(get_component("SELECTOR", transparent=True), (79 + (sim.selid * 64), 16))
+            dirty.append(COMPONENTS_RECT)
 
         # Render display
-        if stats:
-            if spid == 0:
-                percv = pet["hunger"] * 27 / HUNGER_NEEDSTOEAT
-            elif spid == 1:
-                percv = pet["age"] * 27 / AGE_DEATHFROMNATURALCAUSES
-            elif spid == 2:
-                percv = (pet["waste"] % WASTE_EXPUNGE) * 27 / WASTE_EXPUNGE
-            elif spid == 3:
-                percv = pet["energy"] * 27 / 256
-            elif spid == 4:
-                percv = 0
-            if percv > 27:
-                percv = 27
-            render_display(screen, stats_page, PIXEL_COLOR, NONPIXEL_COLOR, 0, percv)
-        else:
-            if has_overlay:
-                animation = np.bitwise_or(current_anim[frame], overlay_anim[ol_frame])
-            else:
-                animation = current_anim[frame]
-            render_display(screen, animation, PIXEL_COLOR, NONPIXEL_COLOR, off)
+        if prof:
+            prof.begin(profiler.DISPLAY)
+        display_key = sim.display_key()
+        if drawn.get("display") != display_key:
+            drawn["display"] = display_key
+            screen.blit(display_cache.get(sim), DISPLAY_RECT)
+            dirty.append(DISPLAY_RECT)
 
         # Render debug
-        surf = font.render("DEBUG --", True, PIXEL_COLOR)
-        screen.blit(surf, (360, 60))
-        debug = (
-            ("AGE: %s", "HUNGER: %s", "ENERGY: %s", "WASTE: %d", "HAPPINESS: %s"),
-            ("age", "hunger", "energy", "waste", "happiness"),
-        )
-        for pos, y in enumerate(i for i in range(70, 120, 10)):
-            surf = font.render(debug[0][pos] % pet[debug[1][pos]], True, PIXEL_COLOR)
-            screen.blit(surf, (360, y))
-
-        pygame.display.update()
-        clock.tick(FPS)
+        if prof:
+            prof.begin(profiler.HUD)
+        debug_key = tuple(sim.pet.values())
+        if SHOW_PERF:
+            perf = (
+                round(clock.get_fps()),
+                round(frame_ms, 1),
+                round(tick_ms, 1),
+                round(display_cache.hit_rate() * 100),
+            )
+            debug_key += perf
+        if font and drawn.get("debug") != debug_key:
+            drawn["debug"] = debug_key
+            screen.fill(palette[BG_INDEX], DEBUG_RECT)
+            screen.blit(render_text(font, "DEBUG --", palette[PIXEL_INDEX]), (360, 60))
+            debug = (
+                ("AGE: %s", "HUNGER: %s", "ENERGY: %s", "WASTE: %d", "HAPPINESS: %s"),
+                ("age", "hunger", "energy", "waste", "happiness"),
+            )
+            for pos, y in enumerate(i for i in range(70, 120, 10)):
+                text = debug[0][pos] % sim.pet[debug[1][pos]]
+                screen.blit(render_text(font, text, palette[PIXEL_INDEX]), (360, y))
+            if SHOW_PERF:
+                texts = ("FPS: %d", "FRAME: %.1f ms", "TICK: %.1f ms", "LCD CACHE: %d%%")
+                for text, value, y in zip(texts, perf, range(120, 160, 10)):
+                    screen.blit(render_text(font, text % value, palette[PIXEL_INDEX]), (360, y))
+            dirty.append(DEBUG_RECT)
+        if prof:
+            pygame.surfarray.blit_array(screen.subsurface(GRAPH_RECT), prof.graph(GRAPH_RECT.w, GRAPH_RECT.h))
+            dirty.append(GRAPH_RECT)
+
+        # Only the regions whose inputs changed since the last frame are pushed to the window.
+        if prof:
+            prof.begin(profiler.UPDATE)
+        if exposed:
+            pygame.display.update()
+            exposed = False
+        elif dirty:
+            pygame.display.update(dirty)
+        # The work of this frame without the wait that follows, clock.get_rawtime() would include it.
+        frame_ms = (time.perf_counter() - frame_start) * 1000
+        if prof:
+            prof.begin(profiler.IDLE)
+        clock.tick()
+
+        if starting:
+            # The first frame is up, the rest of startup runs before the loop waits for the first time.
+            starting = False
+            timeline.append(("first frame", time.perf_counter()))
+            sh.prefetch(sh.NEXT_STAGE[STAGES[stage]])
+            if font is None:
+                font = pygame.font.Font(find_font(FONT_NAME), FONT_SIZE)
+                timeline.append(("font", time.perf_counter()))
+            if SHOW_STARTUP:
+                print("startup: " + ", ".join(f"{name} {(at - STARTED) * 1000:.1f} ms" for name, at in timeline))
+            if FAST_START:
+                # Straight on to the frame that adds the HUD.
+                events = []
+                continue
+
+        # Nothing on screen changes between game steps and inputs, so block until the next of either.
+        # Animation steps only wake the loop while the cleaning scroll runs, the perf readouts use FPS.
+        timeout = game_time.until_next(sim.cleaning) - (pygame.time.get_ticks() - clock_ms)
+        if SHOW_PERF or prof:
+            timeout = min(timeout, 1000 // FPS)
+        event = pygame.event.wait(max(1, math.ceil(timeout)))
+        events = [] if event.type == NOEVENT else [event]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import os
+
+import assets
+
+
+SPRITES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sprites")
+
+
+def test_missing_or_edited_output_is_converted_again(tmp_path):
+    dest = str(tmp_path / "sprites")
+    converted = assets.convert(SPRITES, dest, "png", "png", workers=1)
+    assert converted
+    assert assets.convert(SPRITES, dest, "png", "png", workers=1) == []
+
+    key = next(key for key in converted if key.startswith("eggs/"))
+    first, *_ = assets.output_files("png", dest, key, len(assets.png_files(SPRITES)[key]))
+    with open(first, "rb") as f:
+        original = f.read()
+    os.remove(first)
+    assert assets.convert(SPRITES, dest, "png", "png", workers=1) == [key]
+    with open(first, "rb") as f:
+        assert f.read() == original
+
+    with open(first, "ab") as f:
+        f.write(b"edited")
+    assert assets.convert(SPRITES, dest, "png", "png", workers=1) == [key]
+    assert assets.convert(SPRITES, dest, "png", "png", workers=1) == []
+
+
+def test_csv_outputs_are_checked(tmp_path):
+    dest = str(tmp_path / "csv")
+    converted = assets.convert(SPRITES, dest, "png", "csv", workers=1)
+    assert assets.convert(SPRITES, dest, "png", "csv", workers=1) == []
+    key = converted[0]
+    os.remove(assets.output_files("csv", dest, key, len(assets.png_files(SPRITES)[key]))[-1])
+    assert assets.convert(SPRITES, dest, "png", "csv", workers=1) == [key]
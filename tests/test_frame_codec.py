@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+import frame_codec
+
+from frame_codec import FrameDecoder, FrameEncoder
+from pet_host import PetHost
+from sprite_handler import PackedSprite
+
+
+def frames(n: int = 200, pets: int = 4):
+    # LCD frames of a few pets going about their day, with animation steps between the ticks.
+    host = PetHost(pets, seed=1)
+    for step in range(n):
+        if step % 10 == 9:
+            host.tick()
+        else:
+            host.animate()
+        yield host.compose(np.arange(pets))[step % pets]
+
+
+def test_round_trip():
+    encoder = FrameEncoder()
+    decoder = FrameDecoder()
+    kinds = set()
+    for rows in frames():
+        data = encoder.encode(rows)
+        kinds.add(data[0])
+        assert decoder.decode(data) == PackedSprite(rows)
+    assert kinds == {frame_codec.KEYFRAME, frame_codec.DELTA, frame_codec.SAME}
+
+
+def test_shifted_and_repeated_frames():
+    base = np.random.default_rng(0).integers(0, 2**32, 32, dtype=np.uint64).astype(np.uint32)
+    sequence = [base, PackedSprite(base).shift(1).rows, PackedSprite(base).shift(-1).rows, base, base]
+    encoder = FrameEncoder()
+    decoder = FrameDecoder()
+    for rows in sequence:
+        data = encoder.encode(PackedSprite(rows))
+        assert decoder.decode(data) == PackedSprite(rows)
+    # A shift of the previous frame only sends the columns shifted in.
+    encoder = FrameEncoder()
+    encoder.encode(base)
+    assert len(encoder.encode(PackedSprite(base).shift(1))) < frame_codec.DELTA_HEADER.size + 32 * 4
+    assert encoder.encode(PackedSprite(base).shift(1))[0] == frame_codec.SAME
+
+
+def test_periodic_keyframe():
+    encoder = FrameEncoder(keyframe_interval=5)
+    kinds = [encoder.encode(np.full(32, i, dtype=np.uint32))[0] for i in range(13)]
+    assert [i for i, kind in enumerate(kinds) if kind == frame_codec.KEYFRAME] == [0, 6, 12]
+    encoder.keyframe()
+    assert encoder.encode(np.zeros(32, dtype=np.uint32))[0] == frame_codec.KEYFRAME
+
+
+def test_lost_frame_waits_for_keyframe():
+    encoder = FrameEncoder(keyframe_interval=3)
+    encoded = [encoder.encode(np.full(32, i, dtype=np.uint32)) for i in range(8)]
+    decoder = FrameDecoder()
+    decoder.decode(encoded[0])
+    with pytest.raises(ValueError):
+        decoder.decode(encoded[2])
+    with pytest.raises(ValueError):
+        decoder.decode(encoded[3])
+    assert encoded[4][0] == frame_codec.KEYFRAME
+    for i in range(4, 8):
+        assert decoder.decode(encoded[i]) == PackedSprite(np.full(32, i, dtype=np.uint32))
+
+
+def test_decoder_needs_a_keyframe_first():
+    encoder = FrameEncoder()
+    encoder.encode(np.zeros(32, dtype=np.uint32))
+    with pytest.raises(ValueError):
+        FrameDecoder().decode(encoder.encode(np.ones(32, dtype=np.uint32)))
+
+
+def test_unknown_kind():
+    decoder = FrameDecoder()
+    decoder.decode(FrameEncoder().encode(np.zeros(32, dtype=np.uint32)))
+    with pytest.raises(ValueError):
+        decoder.decode(frame_codec.HEADER.pack(7, 1))
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from game_clock import ANIMATION, TICK, GameClock
+
+
+def test_steps_in_game_time_order():
+    clock = GameClock(tick_ms=100, animation_ms=40)
+    # Animations at 40, 80, 120, 160, 200, ticks at 100, 200, the animation first when both are due.
+    assert clock.advance(200) == [ANIMATION, ANIMATION, TICK, ANIMATION, ANIMATION, ANIMATION, TICK]
+    assert clock.now == 200
+    assert clock.advance(39) == []
+    assert clock.advance(1) == [ANIMATION]
+
+
+def test_time_scale():
+    clock = GameClock(tick_ms=100, animation_ms=1000, time_scale=4.0)
+    assert clock.advance(50) == [TICK, TICK]
+    assert clock.until_next(animating=False) == 25.0
+
+
+def test_backlog_past_max_steps_is_dropped():
+    clock = GameClock(tick_ms=100, animation_ms=1000, max_steps=5)
+    assert clock.advance(10000) == [TICK] * 5
+    assert clock.now == 500
+    assert clock.dropped_ms == 9500
+    # Nothing is left to catch up on, the clock carries on from where it stopped.
+    assert clock.advance(0) == []
+    assert clock.advance(100) == [TICK]
+    assert clock.dropped_ms == 9500
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import os
+
+import persistence
+import pytest
+
+from persistence import (
+    JOURNAL_SUFFIX,
+    SNAPSHOT_SUFFIX,
+    SaveStore,
+    pack_record,
+    pack_state,
+    read_journal,
+    read_snapshot,
+    unpack_state,
+    write_snapshot,
+)
+from simulation import DOWN, LEFT, RIGHT, PetSimulation
+
+
+def played(seed: int = 7, ticks: int = 300) -> PetSimulation:
+    # A pet with some of everything: hatched, fed, on a stats page and moved around.
+    sim = PetSimulation(seed)
+    for tick in range(ticks):
+        if tick == 150:
+            sim.press(DOWN)
+        if tick == 200:
+            sim.press(RIGHT)
+            sim.press(RIGHT)
+            sim.press(DOWN)
+            sim.press(RIGHT)
+        sim.step()
+    return sim
+
+
+def test_state_round_trip():
+    sim = played()
+    restored = PetSimulation()
+    unpack_state(pack_state(sim), restored)
+    assert pack_state(restored) == pack_state(sim)
+    assert restored.display_key() == sim.display_key()
+    assert dict(restored.pet) == dict(sim.pet)
+
+
+def test_snapshot_round_trip(tmp_path):
+    filename = str(tmp_path / ("save" + SNAPSHOT_SUFFIX))
+    state = pack_state(played())
+    write_snapshot(filename, 42, 1234.5, state)
+    assert read_snapshot(filename) == (42, 1234.5, state)
+
+
+def test_damaged_snapshot_is_ignored(tmp_path):
+    filename = str(tmp_path / ("save" + SNAPSHOT_SUFFIX))
+    write_snapshot(filename, 1, 1.0, pack_state(played()))
+    with open(filename, "r+b") as f:
+        f.seek(persistence.SNAPSHOT_HEADER.size + 3)
+        f.write(b"\xff")
+    assert read_snapshot(filename) is None
+    assert read_snapshot(str(tmp_path / "missing")) is None
+
+
+def test_journal_round_trip(tmp_path):
+    filename = str(tmp_path / ("save" + JOURNAL_SUFFIX))
+    records = [(1, 10.0, persistence.TICK, b"state"), (2, 11.0, persistence.PRESS, b"\x01")]
+    with open(filename, "wb") as f:
+        for record in records:
+            f.write(pack_record(*record))
+    assert read_journal(filename) == (records, os.path.getsize(filename))
+
+
+def test_journal_stops_at_torn_or_corrupt_record(tmp_path):
+    filename = str(tmp_path / ("save" + JOURNAL_SUFFIX))
+    first = pack_record(1, 10.0, persistence.TICK, b"first")
+    second = pack_record(2, 11.0, persistence.TICK, b"second")
+    with open(filename, "wb") as f:
+        f.write(first + second[:-2])
+    assert read_journal(filename) == ([(1, 10.0, persistence.TICK, b"first")], len(first))
+
+    corrupt = bytearray(second)
+    corrupt[-1] ^= 0xFF
+    with open(filename, "wb") as f:
+        f.write(first + bytes(corrupt) + pack_record(3, 12.0, persistence.TICK, b"third"))
+    records, length = read_journal(filename)
+    assert [seq for seq, _, _, _ in records] == [1]
+    assert length == len(first)
+
+
+def test_store_restores_snapshot_and_journal(tmp_path):
+    path = str(tmp_path / "save")
+    store = SaveStore(path, compact_every=50)
+    sim = PetSimulation(3)
+    for tick in range(120):
+        sim.step()
+        store.record_tick(sim)
+        if tick == 60:
+            sim.press(RIGHT)
+            store.record_press(RIGHT)
+    store.flush()
+    assert os.path.getsize(path + JOURNAL_SUFFIX) > 0
+
+    restored = SaveStore(path).restore()
+    assert pack_state(restored) == pack_state(sim)
+
+
+def test_store_replays_presses_after_last_tick(tmp_path):
+    path = str(tmp_path / "save")
+    store = SaveStore(path)
+    sim = PetSimulation(5)
+    sim.step()
+    store.record_tick(sim)
+    for button in (RIGHT, RIGHT, LEFT):
+        sim.press(button)
+        store.record_press(button)
+    store.close()
+    assert pack_state(SaveStore(path).restore()) == pack_state(sim)
+
+
+def test_store_truncates_torn_journal(tmp_path):
+    path = str(tmp_path / "save")
+    store = SaveStore(path)
+    sim = PetSimulation(9)
+    for _ in range(5):
+        sim.step()
+        store.record_tick(sim)
+    store.close()
+    intact = os.path.getsize(path + JOURNAL_SUFFIX)
+    with open(path + JOURNAL_SUFFIX, "ab") as f:
+        f.write(pack_record(99, 1.0, persistence.TICK, pack_state(sim))[:-5])
+
+    restored_store = SaveStore(path)
+    restored = restored_store.restore()
+    assert pack_state(restored) == pack_state(sim)
+    assert restored_store.seq == 5
+    assert os.path.getsize(path + JOURNAL_SUFFIX) == intact
+
+
+def test_store_without_save(tmp_path):
+    assert SaveStore(str(tmp_path / "save")).restore() is None
+
+
+def test_failed_flush_keeps_records(tmp_path):
+    path = str(tmp_path / "missing" / "save")
+    store = SaveStore(path)
+    sim = PetSimulation(4)
+    for _ in range(3):
+        sim.step()
+        store.record_tick(sim)
+    with pytest.warns(UserWarning, match="cannot save"):
+        store.flush()
+    assert isinstance(store.error, OSError)
+    assert len(store.pending) == 3
+
+    sim.press(RIGHT)
+    store.record_press(RIGHT)
+    os.mkdir(tmp_path / "missing")
+    store.flush()
+    assert store.error is None and not store.pending
+    assert pack_state(SaveStore(path).restore()) == pack_state(sim)
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import socket
+
+from pet_server import HIGH_WATER, Client, PetServer
+
+
+async def read_messages(reader: asyncio.StreamReader, until) -> list:
+    messages = []
+    while True:
+        line = await asyncio.wait_for(reader.readline(), 5)
+        if not line:
+            return messages
+        if line.startswith(b"{"):
+            messages.append(json.loads(line))
+            if until(messages[-1]):
+                return messages
+
+
+def test_held_update_is_sent_once_drained():
+    async def run():
+        ours, theirs = socket.socketpair()
+        _, writer = await asyncio.open_connection(sock=ours)
+        reader, peer = await asyncio.open_connection(sock=theirs)
+        client = Client(writer)
+        client.subscriptions[0] = False
+        # Filler the peer has not read yet, the client is held back.
+        while not client.backed_up():
+            writer.write(b"x" * 1023 + b"\n")
+        client.publish(7, {0: {"hunger": 3}}, {})
+        assert client.held_deltas
+        # Nothing else changes, the delta still arrives once the peer catches up.
+        messages = await read_messages(reader, lambda message: message["type"] == "delta")
+        assert messages[-1] == {"type": "delta", "pet": 0, "tick": 7, "changes": {"hunger": 3}}
+        assert not client.held_deltas and client.drainer is None
+        client.close()
+        peer.close()
+
+    asyncio.run(run())
+
+
+def test_line_too_long_is_answered_and_closed():
+    async def run():
+        server = PetServer(4, seed=0)
+        ours, theirs = socket.socketpair()
+        reader, writer = await asyncio.open_connection(sock=theirs)
+        handler = asyncio.ensure_future(server.handle(*await asyncio.open_connection(sock=ours)))
+        writer.write(b"GET " + b"1" * (2 * HIGH_WATER) + b"\n")
+        messages = await read_messages(reader, lambda message: False)
+        assert messages == [{"type": "error", "message": "line too long"}]
+        await asyncio.wait_for(handler, 5)
+        assert not server.clients
+        writer.close()
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import pytest
+
+from game_clock import ANIMATION, GameClock
+from replay import Recording, replay, state_hash
+from simulation import DOWN, LEFT, RIGHT, PetSimulation
+
+
+def record(seed: int = 11, steps: int = 3000) -> Recording:
+    # Plays a session the way the game loop does, pressing a button every few hundred steps.
+    sim = PetSimulation()
+    recording = Recording.begin(sim, seed)
+    clock = GameClock()
+    buttons = (RIGHT, DOWN, LEFT, DOWN)
+    for step in range(steps):
+        if step % 400 == 399:
+            button = buttons[step // 400 % len(buttons)]
+            recording.press(sim, button)
+            sim.press(button)
+        if clock.next_step() == ANIMATION:
+            sim.animate()
+        else:
+            sim.tick()
+    recording.finish(sim)
+    return recording
+
+
+def test_replay_matches_recording():
+    recording = record()
+    assert recording.events
+    assert state_hash(replay(recording)) == recording.final_hash
+
+
+def test_bytes_round_trip(tmp_path):
+    recording = record()
+    filename = str(tmp_path / "session.rec")
+    recording.save(filename)
+    loaded = Recording.load(filename)
+    assert loaded.to_bytes() == recording.to_bytes()
+    assert (loaded.seed, loaded.start, loaded.events) == (recording.seed, recording.start, recording.events)
+    assert (loaded.ticks, loaded.steps, loaded.final_hash) == (recording.ticks, recording.steps, recording.final_hash)
+    assert state_hash(replay(loaded)) == recording.final_hash
+
+
+def test_changed_recording_no_longer_matches():
+    recording = record()
+    tick, step, button = recording.events[0]
+    recording.events[0] = (tick, step, LEFT if button != LEFT else RIGHT)
+    assert state_hash(replay(recording)) != recording.final_hash
+
+    recording = record()
+    recording.seed += 1
+    assert state_hash(replay(recording)) != recording.final_hash
+
+
+def test_not_a_recording():
+    data = bytearray(record(steps=10).to_bytes())
+    data[:4] = b"XXXX"
+    with pytest.raises(ValueError):
+        Recording.from_bytes(bytes(data))
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import numpy as np
+
+import simulation
+
+from persistence import pack_state
+from simulation import (
+    AGE_DEATHFROMNATURALCAUSES,
+    ENERGY_PASSOUT,
+    HUNGER_DEADFROMNOTEATING,
+    TICK_MS,
+    PetSimulation,
+)
+
+TICKS = 3000
+
+
+def events(sim: PetSimulation, seen: dict) -> None:
+    # Records the tick each threshold was first crossed on.
+    for name, reached in (
+        ("hatch", sim.stage >= 1),
+        ("grow_up", sim.stage >= 2),
+        ("pass_out", sim.sleeping and sim.stage > 0),
+        ("death", sim.dead),
+    ):
+        if reached and name not in seen:
+            seen[name] = sim.ticks
+
+
+def stepped(sim: PetSimulation, n_ticks: int) -> dict:
+    seen: dict = {}
+    for _ in range(n_ticks):
+        sim.step()
+        events(sim, seen)
+    return seen
+
+
+def fast_forwarded(sim: PetSimulation, elapsed_ms: int, rng: np.random.Generator) -> dict:
+    # Runs fast_forward and checks that no chunk applied in bulk went past a threshold, a tick by
+    # tick run would have stopped for it.
+    seen: dict = {}
+    skip, step = sim.skip, sim.step
+
+    def checked_skip(n_ticks, rng):
+        before = (sim.stage, sim.sleeping, sim.dead)
+        skip(n_ticks, rng)
+        assert (sim.stage, sim.sleeping, sim.dead) == before
+        assert sim.stage == 0 or sim.sleeping or sim.dead or sim.pet["energy"] >= ENERGY_PASSOUT
+        assert sim.dead or sim.pet["hunger"] < HUNGER_DEADFROMNOTEATING
+        assert sim.dead or sim.pet["age"] < AGE_DEATHFROMNATURALCAUSES
+        seen["skipped"] = seen.get("skipped", 0) + n_ticks
+
+    def checked_step():
+        step()
+        events(sim, seen)
+
+    sim.skip, sim.step = checked_skip, checked_step
+    assert sim.fast_forward(elapsed_ms, rng) == elapsed_ms % TICK_MS
+    return seen
+
+
+def test_fast_forward_without_chunks_matches_stepping(monkeypatch):
+    monkeypatch.setattr(simulation, "MIN_CHUNK", 1 << 62)
+    expected = PetSimulation(2)
+    seen = stepped(expected, TICKS)
+    assert {"hatch", "grow_up", "pass_out", "death"} <= set(seen)
+    sim = PetSimulation(2)
+    assert sim.fast_forward(TICKS * TICK_MS + 500, np.random.default_rng(0)) == 500
+    assert pack_state(sim) == pack_state(expected)
+
+
+def test_fast_forward_stops_at_thresholds():
+    for seed in range(5):
+        expected = stepped(PetSimulation(seed), TICKS)
+        seen = fast_forwarded(PetSimulation(seed), TICKS * TICK_MS, np.random.default_rng(seed))
+        assert seen["skipped"] > TICKS // 2
+        # Age grows by 2 every tick, hatching and growing up happen on exactly the same tick.
+        assert seen["hatch"] == expected["hatch"]
+        assert seen["grow_up"] == expected["grow_up"]
+        assert "pass_out" in seen and "death" in seen
+
+
+def test_fast_forward_dies_of_age_on_the_same_tick():
+    def old_pet() -> PetSimulation:
+        # A grown, awake pet fed and cleaned just before the end of its life.
+        sim = PetSimulation(1)
+        sim.step(500)
+        assert sim.stage == 2 and not (sim.sleeping or sim.dead)
+        sim.pet.update(age=AGE_DEATHFROMNATURALCAUSES - 400, hunger=0, energy=200, waste=0)
+        sim.has_overlay = False
+        return sim
+
+    expected = stepped(old_pet(), 300)
+    seen = fast_forwarded(old_pet(), 300 * TICK_MS, np.random.default_rng(1))
+    assert seen["skipped"] > 0
+    assert seen["death"] == expected["death"]